@@ -0,0 +1,320 @@
+"""
+ann_index.py — Nearest-neighbour indexes over the song embedding table
+Pure NumPy (no GPU, no external service). Vectors are expected to be L2-normalized
+so the inner product equals cosine similarity.
+"""
+import os
+import zlib
+
+import numpy as np
+
+
+def top_k(scores, k):
+    """Indices of the `k` highest scores, best first, without sorting the whole array."""
+    k = min(k, scores.shape[0])
+    if k <= 0:
+        return np.empty(0, dtype=np.intp)
+    if k < scores.shape[0]:
+        candidates = np.argpartition(scores, -k)[-k:]
+    else:
+        candidates = np.arange(scores.shape[0])
+    return candidates[np.argsort(scores[candidates])[::-1]]
+
+
+def top_k_rows(scores, k):
+    """Row-wise `top_k` over a 2-D score block: returns a (rows, k) index array, best first per row."""
+    k = min(k, scores.shape[1])
+    if k < scores.shape[1]:
+        candidates = np.argpartition(scores, -k, axis=1)[:, -k:]
+    else:
+        candidates = np.broadcast_to(np.arange(scores.shape[1]), scores.shape)
+    order = np.argsort(np.take_along_axis(scores, candidates, axis=1), axis=1)[:, ::-1]
+    return np.take_along_axis(candidates, order, axis=1)
+
+
+def fingerprint(vectors):
+    """Cheap content checksum used to detect a persisted index that no longer matches its vectors."""
+    stride = max(1, vectors.shape[0] // 4096)
+    sample = np.ascontiguousarray(vectors[::stride])
+    return f"{vectors.shape[0]}x{vectors.shape[1]}:{zlib.crc32(sample.tobytes()):08x}"
+
+
+class RowSubset:
+    """Eligible rows for a filtered search, held both as a boolean mask and as sorted row ids."""
+    __slots__ = ('mask', 'rows')
+
+    def __init__(self, mask, rows=None):
+        self.mask = mask
+        self.rows = np.flatnonzero(mask) if rows is None else rows
+
+    def __len__(self):
+        return self.rows.shape[0]
+
+
+class RowBlocks:
+    """
+    Read-only row-wise stack of matrices (a memory-mapped base plus small appended blocks) that is never
+    materialized: products and row gathers run per block, so the base stays a shared page-cache mapping.
+    Supports what the indexes need: len/shape/dtype/nbytes, row indexing (int, slice, index array),
+    `blocks @ query` and `queries @ blocks.T`.
+    """
+    # Makes `ndarray @ RowBlocks.T` defer to _TransposedRows.__rmatmul__ instead of coercing to an array
+    __array_ufunc__ = None
+    ndim = 2
+
+    def __init__(self, *blocks):
+        self.blocks = blocks
+        self.starts = np.cumsum([0] + [block.shape[0] for block in blocks])
+        self.shape = (int(self.starts[-1]),) + tuple(blocks[0].shape[1:])
+        self.dtype = np.result_type(*(block.dtype for block in blocks))
+
+    def __len__(self):
+        return self.shape[0]
+
+    @property
+    def nbytes(self):
+        return sum(block.nbytes for block in self.blocks)
+
+    @property
+    def T(self):
+        return _TransposedRows(self)
+
+    def __matmul__(self, other):
+        return np.concatenate([block @ other for block in self.blocks])
+
+    def __getitem__(self, key):
+        n = self.shape[0]
+        if isinstance(key, (int, np.integer)):
+            key = int(key) + n if key < 0 else int(key)
+            b = int(np.searchsorted(self.starts, key, 'right')) - 1
+            return self.blocks[b][key - self.starts[b]]
+        if isinstance(key, slice):
+            start, stop, step = key.indices(n)
+            if step == 1 and stop <= self.starts[1]:
+                return self.blocks[0][start:stop]
+            key = np.arange(start, stop, step)
+        key = np.asarray(key)
+        if key.dtype == bool:
+            key = np.flatnonzero(key)
+        key = np.where(key < 0, key + n, key)
+        which = np.searchsorted(self.starts, key, 'right') - 1
+        out = np.empty(key.shape + self.shape[1:], dtype=self.dtype)
+        for b, block in enumerate(self.blocks):
+            sel = which == b
+            if sel.any():
+                out[sel] = block[key[sel] - self.starts[b]]
+        return out
+
+
+class _TransposedRows:
+    """`RowBlocks.T`: only usable as the right operand of a matrix product."""
+    __array_ufunc__ = None
+
+    def __init__(self, rows):
+        self.rows = rows
+
+    def __rmatmul__(self, other):
+        return np.concatenate([other @ block.T for block in self.rows.blocks], axis=-1)
+
+
+# A subset smaller than this fraction of the catalog is scored by gathering its rows;
+# larger ones are cheaper to score in full and then index
+GATHER_FRACTION = 0.25
+
+
+class ExactIndex:
+    """Brute-force inner-product search. Always correct; cost is linear in the catalog size."""
+    kind = "exact"
+
+    def __init__(self, vectors):
+        self.vectors = vectors
+
+    def search(self, query, k, subset=None):
+        """Top-k rows by inner product, restricted to `subset` (a RowSubset) when given."""
+        if subset is None:
+            scores = self.vectors @ query
+            indices = top_k(scores, k)
+            return indices, scores[indices]
+
+        if len(subset) < GATHER_FRACTION * self.vectors.shape[0]:
+            scores = self.vectors[subset.rows] @ query
+        else:
+            scores = (self.vectors @ query)[subset.rows]
+        best = top_k(scores, k)
+        return subset.rows[best], scores[best]
+
+    def search_many(self, queries, k, subset=None):
+        """Row-wise top-k for a block of queries in one matrix product: ((q, k) indices, (q, k) scores)."""
+        gather = subset is not None and len(subset) < GATHER_FRACTION * self.vectors.shape[0]
+        scores = queries @ (self.vectors[subset.rows] if gather else self.vectors).T
+        if subset is not None and not gather:
+            scores[:, ~subset.mask] = -np.inf
+            # Never let masked (-inf) rows fill a pool larger than the subset
+            k = min(k, len(subset))
+        indices = top_k_rows(scores, k)
+        top_scores = np.take_along_axis(scores, indices, axis=1)
+        return (subset.rows[indices] if gather else indices), top_scores
+
+    def search_max(self, queries, k, subset=None, block_cells=1 << 24):
+        """
+        Top-k rows by their best inner product with any of `queries`. The catalog is scored in row
+        blocks of one matrix product each, so only a (block, q) score matrix is ever materialized.
+        """
+        rows = subset.rows if subset is not None else None
+        n = len(rows) if rows is not None else self.vectors.shape[0]
+        block = max(1, block_cells // max(queries.shape[0], 1))
+        scores = np.empty(n, dtype=np.result_type(self.vectors.dtype, queries.dtype))
+        for start in range(0, n, block):
+            stop = min(start + block, n)
+            vectors = self.vectors[rows[start:stop]] if rows is not None else self.vectors[start:stop]
+            scores[start:stop] = (vectors @ queries.T).max(axis=1)
+        best = top_k(scores, k)
+        return (rows[best] if rows is not None else best), scores[best]
+
+
+class IVFFlatIndex:
+    """
+    Inverted-file index: spherical k-means partitions the vectors into `n_lists` cells,
+    and a query only scans the `nprobe` cells whose centroids are closest to it.
+    """
+    kind = "ivf"
+
+    def __init__(self, vectors, centroids, order, offsets, nprobe=16):
+        self.vectors = vectors
+        self.centroids = centroids
+        self.order = order
+        self.offsets = offsets
+        self.nprobe = nprobe
+        self._exact = ExactIndex(vectors)
+        # Set when rows appended after the persisted build were filed in on load (see _add_rows)
+        self.extended = False
+
+    @classmethod
+    def build(cls, vectors, n_lists=None, nprobe=None, iterations=12, seed=0):
+        n = vectors.shape[0]
+        if n_lists is None:
+            n_lists = max(1, int(4 * np.sqrt(n)))
+        n_lists = min(n_lists, n)
+        if nprobe is None:
+            nprobe = min(16, n_lists)
+
+        rng = np.random.default_rng(seed)
+        train = vectors[rng.choice(n, size=min(n, n_lists * 40), replace=False)]
+        centroids = train[rng.choice(train.shape[0], size=n_lists, replace=False)].copy()
+
+        for _ in range(iterations):
+            assign = cls._assign(train, centroids)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assign, train)
+            norms = np.linalg.norm(sums, axis=1, keepdims=True)
+            # Empty cells keep their previous centroid
+            filled = norms[:, 0] > 0
+            centroids[filled] = sums[filled] / norms[filled]
+
+        assign = cls._assign(vectors, centroids)
+        order = np.argsort(assign, kind="stable").astype(np.int32)
+        offsets = np.searchsorted(assign[order], np.arange(n_lists + 1)).astype(np.int64)
+        return cls(vectors, centroids, order, offsets, nprobe)
+
+    @staticmethod
+    def _assign(vectors, centroids, chunk=65536):
+        """Nearest centroid per vector, in chunks to bound the temporary score matrix."""
+        out = np.empty(vectors.shape[0], dtype=np.int32)
+        for start in range(0, vectors.shape[0], chunk):
+            out[start:start + chunk] = np.argmax(vectors[start:start + chunk] @ centroids.T, axis=1)
+        return out
+
+    def search(self, query, k, subset=None):
+        """Approximate top-k rows by inner product, restricted to `subset` (a RowSubset) when given."""
+        probe = top_k(self.centroids @ query, self.nprobe)
+        rows = np.concatenate([self.order[self.offsets[c]:self.offsets[c + 1]] for c in probe])
+        if subset is not None:
+            rows = rows[subset.mask[rows]]
+        if rows.shape[0] < k:
+            # Probed cells are too sparse (or too filtered) to fill the request: fall back to the exact scan
+            return self._exact.search(query, k, subset)
+        scores = self.vectors[rows] @ query
+        best = top_k(scores, k)
+        return rows[best], scores[best]
+
+    def save(self, path):
+        """Writes the index to `path`, replacing any previous file atomically (workers may race on first build)."""
+        tmp_path = f"{path}.tmp-{os.getpid()}"
+        try:
+            # A file object, so np.savez does not append its own suffix to the temporary name
+            with open(tmp_path, 'wb') as f:
+                np.savez(f, centroids=self.centroids, order=self.order, offsets=self.offsets,
+                         nprobe=self.nprobe, fingerprint=fingerprint(self.vectors))
+            os.replace(tmp_path, path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    @classmethod
+    def load(cls, path, vectors):
+        """
+        Loads a persisted index, or returns None when it is missing, unreadable (e.g. truncated) or
+        was built from other vectors, so the caller rebuilds it. An index over a prefix of `vectors`
+        (rows appended since) still loads; the new rows are assigned to their nearest cells.
+        """
+        if not os.path.exists(path):
+            return None
+        try:
+            with np.load(path) as data:
+                stored = str(data['fingerprint'])
+                rows = int(stored.split('x', 1)[0])
+                if rows > vectors.shape[0] or stored != fingerprint(vectors[:rows]):
+                    return None
+                index = cls(vectors, data['centroids'], data['order'], data['offsets'], int(data['nprobe']))
+        except Exception as e:
+            print(f"❌ Ignoring unreadable ANN index {path}: {e}")
+            return None
+        if rows < vectors.shape[0]:
+            index._add_rows(rows)
+        return index
+
+    def _add_rows(self, start):
+        """Files rows `start`.. of the vectors (appended after the build) into their nearest cells."""
+        n_lists = self.centroids.shape[0]
+        assign = np.empty(self.vectors.shape[0], dtype=np.int32)
+        assign[self.order] = np.repeat(np.arange(n_lists, dtype=np.int32), np.diff(self.offsets))
+        assign[start:] = self._assign(self.vectors[start:], self.centroids)
+        self.order = np.argsort(assign, kind="stable").astype(np.int32)
+        self.offsets = np.searchsorted(assign[self.order], np.arange(n_lists + 1)).astype(np.int64)
+        self.extended = True
+
+
+# Below this size a brute-force scan is already sub-millisecond
+ANN_MIN_TRACKS = 50_000
+
+
+def build_index(vectors, cache_path=None, kind=None):
+    """
+    Returns the search index for `vectors`.
+    `kind` is 'exact', 'ivf' or 'auto' (default, from the ANN_INDEX env var): IVF above ANN_MIN_TRACKS.
+    IVF indexes are loaded from / persisted to `cache_path` when given; one loaded as a prefix of
+    `vectors` is saved again once extended, so later loads do not re-assign the appended rows.
+    """
+    kind = kind or os.environ.get('ANN_INDEX', 'auto')
+    if kind == 'exact' or (kind == 'auto' and vectors.shape[0] < ANN_MIN_TRACKS):
+        return ExactIndex(vectors)
+
+    index = IVFFlatIndex.load(cache_path, vectors) if cache_path else None
+    if index is not None:
+        print(f"✅ ANN index loaded from: {cache_path}")
+        if index.extended:
+            _save_index(index, cache_path, "extended to appended rows and saved to")
+        return index
+
+    index = IVFFlatIndex.build(vectors)
+    if cache_path:
+        _save_index(index, cache_path, "built and saved to")
+    return index
+
+
+def _save_index(index, cache_path, done):
+    try:
+        index.save(cache_path)
+        print(f"✅ ANN index {done}: {cache_path}")
+    except OSError as e:
+        print(f"❌ Error saving ANN index: {e}")
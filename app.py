@@ -1,25 +1,255 @@
-from flask import Flask, render_template, request, jsonify
+from flask import Flask, Response, g, render_template, request, jsonify, stream_with_context
+from functools import wraps
+from itertools import chain
+import hmac
+import json
 import os
+import threading
+import time
+import metrics
+import nlp_engine
+from catalog_filters import normalize_filters
 from model_utils import MusicEngine
 
 app = Flask(__name__)
 
-engine = MusicEngine()
+# The engine loads in a background thread so the worker binds its port (and serves `/`,
+# health checks and vibe parsing) immediately; data endpoints answer 503 until it is ready.
+engine = None
+engine_error = None
+time_to_ready = None
+_process_started = time.monotonic()
+
+RETRY_AFTER_SECONDS = 5
+MAX_TRANSITION_STEPS = 50
+# Upper bound on `limit` (recommendations per seed / request)
+MAX_RESULTS = 100
+# Per-stage timings of each request in a Server-Timing response header (needs METRICS_ENABLED)
+SERVER_TIMING = os.environ.get('SERVER_TIMING', '0').lower() in ('1', 'true', 'yes', 'on')
+# Bearer token for POST /admin/reload; the endpoint does not exist while it is unset
+ADMIN_TOKEN = os.environ.get('ADMIN_TOKEN') or None
+# Seconds between checks of the catalog files for a hot reload (0 = no watcher)
+CATALOG_WATCH_SECONDS = float(os.environ.get('CATALOG_WATCH_SECONDS', '0'))
+
+# Hot reloads: one at a time; the outcome of the latest is reported by /readyz
+_reload_lock = threading.Lock()
+last_reload = None
+
+def _load_engine():
+    global engine, engine_error, time_to_ready
+    try:
+        loaded = MusicEngine()
+    except Exception as e:
+        engine_error = str(e)
+        print(f"❌ Engine failed to load: {e}")
+        return
+    if engine is None:
+        engine = loaded
+    time_to_ready = round(time.monotonic() - _process_started, 3)
+    print(f"✅ Engine ready in {time_to_ready}s")
+
+threading.Thread(target=_load_engine, name='engine-loader', daemon=True).start()
+
+def catalog_version(current=None):
+    """Version stamp of the catalog an engine serves (the current one by default); None while loading."""
+    current = current or engine
+    return current.catalog_version if current is not None else None
+
+def reload_engine():
+    """
+    Builds a new engine from the catalog files on disk and swaps it in with one reference assignment.
+    Requests already running finish on the engine they started with (see requires_engine); the old
+    engine's caches are dropped after the swap. Returns False when a reload was already running.
+    """
+    global engine, engine_error, last_reload
+    if not _reload_lock.acquire(blocking=False):
+        return False
+    try:
+        started = time.monotonic()
+        current = engine
+        try:
+            loaded = MusicEngine(data_dir=current.data_dir if current is not None else None)
+            if loaded.df is None or loaded.df.empty:
+                raise ValueError("catalog is empty")
+        except Exception as e:
+            last_reload = {"status": "failed", "error": str(e), "version": catalog_version(current)}
+            print(f"❌ Catalog reload failed, still serving {catalog_version(current)}: {e}")
+            return True
+        engine, engine_error = loaded, None
+        if current is not None:
+            current.invalidate_caches()
+        last_reload = {"status": "ok", "version": loaded.catalog_version,
+                       "seconds": round(time.monotonic() - started, 3)}
+        print(f"✅ Catalog {loaded.catalog_version} swapped in ({len(loaded.df)} tracks, {last_reload['seconds']}s)")
+        return True
+    finally:
+        _reload_lock.release()
+
+def _watch_catalog():
+    """Polls the catalog files' version stamp and hot-reloads when they change (once per new stamp on failure)."""
+    failed_version = None
+    while True:
+        time.sleep(CATALOG_WATCH_SECONDS)
+        current = engine
+        if current is None:
+            continue
+        on_disk = current.source_version()
+        if on_disk is None or on_disk in (current.catalog_version, failed_version):
+            continue
+        print(f"🔄 Catalog files changed ({current.catalog_version} -> {on_disk}), reloading...")
+        reload_engine()
+        failed_version = on_disk if engine is current else None
+
+if CATALOG_WATCH_SECONDS > 0:
+    threading.Thread(target=_watch_catalog, name='catalog-watcher', daemon=True).start()
+
+def _not_ready_response(**extra):
+    resp = jsonify({
+        "error": "Engine failed to load" if engine_error else "Engine is warming up, please retry shortly",
+        "status": "failed" if engine_error else "warming",
+        **extra,
+    })
+    resp.status_code = 503
+    if not engine_error:
+        resp.headers['Retry-After'] = str(RETRY_AFTER_SECONDS)
+    return resp
+
+def _request_filters(req):
+    """Year / tempo / duration filter spec from the request body (see catalog_filters.py); ValueError if malformed."""
+    return normalize_filters(req.get('filters'))
+
+def _request_diversity(req):
+    """Diversity re-ranking options {diversity, max_per_artist} from the request body; ValueError if out of range."""
+    diversity, max_per_artist = req.get('diversity'), req.get('max_per_artist')
+    if diversity is not None:
+        diversity = float(diversity)
+        if not 0 <= diversity <= 1:
+            raise ValueError("diversity must be between 0 and 1")
+    if max_per_artist is not None:
+        max_per_artist = int(max_per_artist)
+        if max_per_artist < 1:
+            raise ValueError("max_per_artist must be at least 1")
+    return {"diversity": diversity, "max_per_artist": max_per_artist}
+
+def requires_engine(view):
+    """
+    Answers 503 + Retry-After while the catalog is still loading. Otherwise pins the current engine
+    as g.engine, so the whole request is served by one catalog version even if a reload swaps it.
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        current = engine
+        if current is None:
+            return _not_ready_response()
+        g.engine = current
+        return view(*args, **kwargs)
+    return wrapper
+
+@app.before_request
+def _start_request_timing():
+    if metrics.ENABLED:
+        g.request_started = time.perf_counter()
+        metrics.begin_request()
+
+@app.after_request
+def _finish_request_timing(response):
+    if metrics.ENABLED and 'request_started' in g:
+        total = time.perf_counter() - g.request_started
+        timings = metrics.end_request()
+        metrics.REQUEST_SECONDS.observe(request.endpoint or 'unmatched', total)
+        if SERVER_TIMING and timings is not None:
+            response.headers['Server-Timing'] = metrics.server_timing_header(timings, total)
+    return response
+
+@app.after_request
+def _catalog_version_header(response):
+    version = catalog_version(g.get('engine'))
+    if version is not None:
+        response.headers['X-Catalog-Version'] = version
+    return response
+
+def _resident_bytes():
+    """Current RSS of this process (Linux /proc; peak RSS elsewhere)."""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError, AttributeError):
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
 
 @app.route('/')
 def index():
     return render_template('index.html')
 
+@app.route('/healthz', methods=['GET'])
+def healthz():
+    """Liveness: the process is up and serving, whether or not the catalog has loaded."""
+    return jsonify({"status": "ok"})
+
+@app.route('/readyz', methods=['GET'])
+def readyz():
+    """Readiness: 200 once the engine is loaded, with the time it took (startup regression tracking)."""
+    if engine is None:
+        return _not_ready_response(uptime=round(time.monotonic() - _process_started, 3))
+    current = engine
+    return jsonify({
+        "status": "ready",
+        "time_to_ready": time_to_ready,
+        "tracks": 0 if current.df is None else len(current.df),
+        "catalog_version": current.catalog_version,
+        "reloading": _reload_lock.locked(),
+        "last_reload": last_reload,
+    })
+
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    """Prometheus text exposition: stage/request latency histograms, caches, catalog size and memory."""
+    if not metrics.ENABLED:
+        return jsonify({"error": "Metrics are disabled"}), 404
+
+    gauges = [
+        ("music_engine_ready", "1 once the catalog is loaded.", int(engine is not None)),
+        ("music_process_resident_bytes", "Resident memory of this worker process.", _resident_bytes()),
+    ]
+    if time_to_ready is not None:
+        gauges.append(("music_time_to_ready_seconds", "Seconds from process start to a loaded engine.", time_to_ready))
+    current = engine
+    if current is not None:
+        cache_stats = current.cache_stats()
+        gauges += [
+            ("music_catalog_tracks", "Tracks in the loaded catalog.", 0 if current.df is None else len(current.df)),
+            ("music_catalog_info", "Always 1; labelled with the version stamp of the loaded catalog.",
+             {f'version="{current.catalog_version}"': 1}),
+            ("music_catalog_bytes", "Bytes held by catalog structures (memory-mapped arrays at full size).",
+             {f'part="{part}"': size for part, size in current.memory_footprint().items()}),
+            ("music_cache_entries", "Entries per cache layer.",
+             {f'cache="{name}"': stats['size'] for name, stats in cache_stats.items()}),
+            ("music_cache_hits", "Cache hits per layer since start.",
+             {f'cache="{name}"': stats['hits'] for name, stats in cache_stats.items()}),
+            ("music_cache_misses", "Cache misses per layer since start.",
+             {f'cache="{name}"': stats['misses'] for name, stats in cache_stats.items()}),
+            ("music_cache_hit_ratio", "Hit ratio per cache layer since start.",
+             {f'cache="{name}"': stats['hit_rate'] for name, stats in cache_stats.items()}),
+        ]
+    return Response(metrics.render(gauges), mimetype='text/plain; version=0.0.4')
+
 @app.route('/parse_vibe', methods=['GET'])
 def parse_vibe():
     """Live NLP endpoint — called by the frontend as user types a vibe description."""
     text = request.args.get('q', '').strip()
     if not text:
         return jsonify({"features": None, "tags": [], "matched_terms": [], "confidence": 0.0})
-    result = engine.parse_vibe_full(text)
+    # The parser needs no catalog data, so it keeps working while the engine warms up
+    current = engine
+    if current is not None:
+        result = current.parse_vibe_full(text)
+    else:
+        with metrics.stage('nlp_parse'):
+            result = nlp_engine.parse_vibe(text)
     return jsonify(result)
 
 @app.route('/recommend', methods=['POST'])
+@requires_engine
 def recommend():
     req = request.json
     song_name = req.get('song_name', '').strip()
@@ -27,19 +257,24 @@ def recommend():
     if not song_name:
         return jsonify({"error": "Please enter a song name"}), 400
 
-    limit = int(req.get('limit', 10))
+    limit = max(1, min(int(req.get('limit', 10)), MAX_RESULTS))
     is_vibe_mode = req.get('is_vibe_mode', False)
     vibe_features = req.get('vibe_features')  # Pre-parsed features from frontend NLP
     allow_explicit = req.get('allow_explicit', True)
+    try:
+        filters = _request_filters(req)
+        diversity = _request_diversity(req)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
 
     # ── FAST PATH: Vibe mode with pre-parsed features ────────────
     if is_vibe_mode and vibe_features:
         # Request limit + 1 so we can use the top result as the "selected" card
-        recommendations = engine.get_recommendations_by_features(vibe_features, limit=limit + 1, allow_explicit=allow_explicit)
+        recommendations = g.engine.get_recommendations_by_features(vibe_features, limit=limit + 1, allow_explicit=allow_explicit, filters=filters)
         
         if recommendations:
             selected = recommendations.pop(0)
-            vibe_result = engine.parse_vibe_full(song_name)
+            vibe_result = g.engine.parse_vibe_full(song_name)
             
             # Inject the vibe context into the real track
             selected["vibe_tags"] = vibe_result.get('tags', []) if vibe_result else []
@@ -51,17 +286,17 @@ def recommend():
             })
 
     # Search for the song
-    search_results = engine.search_song(song_name)
+    search_results = g.engine.search_song(song_name)
     
     # NEW: Mood/Vibe NLP Fallback
     if not search_results or (len(search_results) > 0 and search_results[0].get('match_score', 0) < 70):
-        vibe_result = engine.parse_vibe_full(song_name)
+        vibe_result = g.engine.parse_vibe_full(song_name)
         target_dna = vibe_result.get('features') if vibe_result else None
         if not target_dna:
-            target_dna = engine.resolve_mood(song_name)  # Legacy fallback
+            target_dna = g.engine.resolve_mood(song_name)  # Legacy fallback
         if target_dna:
             # Request limit + 1 so we can use the top result as the "selected" card
-            recommendations = engine.get_recommendations_by_features(target_dna, limit=limit + 1, allow_explicit=allow_explicit)
+            recommendations = g.engine.get_recommendations_by_features(target_dna, limit=limit + 1, allow_explicit=allow_explicit, filters=filters)
             
             if recommendations:
                 selected = recommendations.pop(0)
@@ -79,11 +314,13 @@ def recommend():
 
     best_match = search_results[0]
     
-    # Get recommendations using embeddings + filters
-    result = engine.get_recommendations(
-        seed_song_name=best_match['name'], 
+    # Get recommendations using embeddings + filters (by id: duplicate titles resolve to the searched track)
+    result = g.engine.get_recommendations(
+        seed_id=best_match['id'],
         limit=limit,
-        allow_explicit=allow_explicit
+        allow_explicit=allow_explicit,
+        filters=filters,
+        **diversity
     )
     
     if result:
@@ -95,17 +332,210 @@ def recommend():
             "recommendations": search_results[1:] if len(search_results) > 1 else []
         })
 
+def _vibe_selected_stream(features, vibe_result, limit, allow_explicit, filters, chunk_size):
+    """
+    Feature-based event stream whose top track becomes the "selected" card, or None when nothing
+    matches. The first chunk is scored eagerly so the caller can still fall back or answer 404.
+    """
+    chunks = g.engine.iter_recommendations_by_features(features, limit=limit + 1, allow_explicit=allow_explicit,
+                                                     filters=filters, chunk_size=chunk_size)
+    first = next(chunks, None)
+    if not first:
+        return None
+
+    selected = first.pop(0)
+    selected["vibe_tags"] = vibe_result.get('tags', []) if vibe_result else []
+    selected["vibe_terms"] = vibe_result.get('matched_terms', []) if vibe_result else []
+
+    def events():
+        yield "selected", selected
+        if first:
+            yield "recommendations", first
+        for chunk in chunks:
+            yield "recommendations", chunk
+    return events()
+
+def _stream_response(events):
+    """Serializes (event, payload) pairs as NDJSON, or as Server-Sent Events when the client accepts them."""
+    sse = request.accept_mimetypes.best == 'text/event-stream'
+
+    def body():
+        count = 0
+        for event, payload in events:
+            if event == "recommendations":
+                count += len(payload)
+            if sse:
+                yield f"event: {event}\ndata: {json.dumps(payload)}\n\n"
+            else:
+                yield json.dumps({"event": event, "data": payload}) + "\n"
+        done = {"count": count}
+        yield f"event: done\ndata: {json.dumps(done)}\n\n" if sse else json.dumps({"event": "done", "data": done}) + "\n"
+
+    resp = Response(stream_with_context(body()), mimetype='text/event-stream' if sse else 'application/x-ndjson')
+    resp.headers['Cache-Control'] = 'no-cache'
+    resp.headers['X-Accel-Buffering'] = 'no'  # keep reverse proxies from holding chunks back
+    return resp
+
+@app.route('/recommend_stream', methods=['POST'])
+@requires_engine
+def recommend_stream():
+    """
+    Streaming /recommend: the selected track goes out as soon as it is known, then the
+    recommendations follow in ranked chunks of `chunk_size`, so the first card does not wait on `limit`.
+    Same request body and decision path as /recommend.
+    """
+    req = request.json
+    song_name = req.get('song_name', '').strip()
+
+    if not song_name:
+        return jsonify({"error": "Please enter a song name"}), 400
+
+    limit = max(1, min(int(req.get('limit', 10)), MAX_RESULTS))
+    chunk_size = max(1, int(req.get('chunk_size', 5)))
+    is_vibe_mode = req.get('is_vibe_mode', False)
+    vibe_features = req.get('vibe_features')
+    allow_explicit = req.get('allow_explicit', True)
+    try:
+        filters = _request_filters(req)
+        diversity = _request_diversity(req)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    if is_vibe_mode and vibe_features:
+        events = _vibe_selected_stream(vibe_features, g.engine.parse_vibe_full(song_name), limit, allow_explicit, filters, chunk_size)
+        if events:
+            return _stream_response(events)
+
+    search_results = g.engine.search_song(song_name)
+
+    # Mood/Vibe NLP fallback, as in /recommend
+    if not search_results or search_results[0].get('match_score', 0) < 70:
+        vibe_result = g.engine.parse_vibe_full(song_name)
+        target_dna = (vibe_result.get('features') if vibe_result else None) or g.engine.resolve_mood(song_name)
+        if target_dna:
+            events = _vibe_selected_stream(target_dna, vibe_result, limit, allow_explicit, filters, chunk_size)
+            if events:
+                return _stream_response(events)
+
+    if not search_results:
+        return jsonify({"error": "No match found. Try a song or mood (e.g. 'Cyberpunk', 'Sunset')"}), 404
+
+    best_match = search_results[0]
+    events = g.engine.iter_recommendations(seed_id=best_match['id'], limit=limit, allow_explicit=allow_explicit,
+                                         filters=filters, chunk_size=chunk_size, **diversity)
+    # The seed is resolved (and "selected" produced) before any scoring happens
+    first = next(events, None)
+    if first is None:
+        events = iter([("selected", best_match), ("recommendations", search_results[1:])])
+    else:
+        events = chain([first], events)
+    return _stream_response(events)
+
+@app.route('/recommend_batch', methods=['POST'])
+@requires_engine
+def recommend_batch():
+    """Seed recommendations for many songs in one call (scored together in a single pass over the catalog)."""
+    req = request.json
+    song_names = [s.strip() for s in req.get('song_names', []) if s and s.strip()]
+
+    if not song_names:
+        return jsonify({"error": "Please provide at least one song name"}), 400
+
+    limit = max(1, min(int(req.get('limit', 10)), MAX_RESULTS))
+    allow_explicit = req.get('allow_explicit', True)
+    try:
+        filters = _request_filters(req)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    # Resolve each query to its best catalog match, as /recommend does
+    best_matches = []
+    for name in song_names:
+        search_results = g.engine.search_song(name)
+        best_matches.append(search_results[0] if search_results else None)
+
+    seed_ids = [m['id'] for m in best_matches if m]
+    batch = iter(g.engine.get_recommendations_batch(seed_ids=seed_ids, limit=limit, allow_explicit=allow_explicit, filters=filters))
+
+    results = []
+    for name, match in zip(song_names, best_matches):
+        result = next(batch) if match else None
+        if result:
+            results.append(result)
+        elif match:
+            results.append({"selected": match, "recommendations": []})
+        else:
+            results.append({"error": f"No match found for '{name}'"})
+
+    return jsonify({"results": results})
+
+@app.route('/transition_path', methods=['POST'])
+@requires_engine
+def transition_path():
+    """Ordered, non-repeating track sequence that morphs from song_a into song_b in `steps` hops."""
+    req = request.json
+    song_a = req.get('song_a', '').strip()
+    song_b = req.get('song_b', '').strip()
+
+    if not song_a or not song_b:
+        return jsonify({"error": "Please provide both song_a and song_b"}), 400
+
+    steps = max(1, min(int(req.get('steps', 5)), MAX_TRANSITION_STEPS))
+    allow_explicit = req.get('allow_explicit', True)
+    try:
+        filters = _request_filters(req)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    matches = []
+    for name in (song_a, song_b):
+        search_results = g.engine.search_song(name)
+        if not search_results:
+            return jsonify({"error": f"No match found for '{name}'"}), 404
+        matches.append(search_results[0])
+
+    result = g.engine.build_transition_path(song_a_id=matches[0]['id'], song_b_id=matches[1]['id'], steps=steps,
+                                          allow_explicit=allow_explicit, filters=filters)
+    if not result:
+        return jsonify({"error": "Could not build a transition path"}), 404
+    return jsonify(result)
+
 @app.route('/recommend_mix', methods=['POST'])
+@requires_engine
 def recommend_mix():
     req = request.json
     mix_items = req.get('songs', [])
-    limit = int(req.get('limit', 3))
+    limit = max(1, min(int(req.get('limit', 3)), MAX_RESULTS))
     allow_explicit = req.get('allow_explicit', True)
     
+    strategy = req.get('strategy', 'centroid')
+    
     if not mix_items:
         return jsonify({"error": "Mix is empty"}), 400
+    try:
+        filters = _request_filters(req)
+        # A mix whose tracks the catalog all knows by id is built server-side from their catalog features
+        track_ids = [s.get('id') for s in mix_items]
+        recs = None
+        if all(track_ids):
+            recs = g.engine.get_mix_recommendations(track_ids, limit=limit, strategy=strategy,
+                                                  allow_explicit=allow_explicit, filters=filters)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    if recs is not None:
+        if recs:
+            # Distinct tracks actually mixed (a repeated id counts once)
+            members = len(set(map(str, track_ids)))
+            response = {"type": "bridge" if members == 2 else "ensemble", "strategy": strategy,
+                        "recommendations": recs}
+            if members == 2:
+                response["note"] = "Alchemist Bridge: Finding sonic midpoints"
+            return jsonify(response)
+        return jsonify({"error": "Could not find matching tracks"}), 404
 
+    # Fallback when any track is unknown: blend the features the client sent for every track
     features_to_blend = ['energy', 'valence', 'danceability', 'acousticness', 'speechiness', 'instrumentalness']
+    exclude_names = [s['name'] for s in mix_items if s.get('name')]
 
     # NEW: The Alchemist Bridge - Special case for exactly 2 tracks
     if len(mix_items) == 2:
@@ -113,7 +543,7 @@ def recommend_mix():
         f2 = mix_items[1].get('features', {})
         avg_dna = {f: (f1.get(f, 0.5) + f2.get(f, 0.5)) / 2.0 for f in features_to_blend}
         
-        recs = engine.get_recommendations_by_features(avg_dna, limit=limit, exclude_names=[s.get('name') for s in mix_items], allow_explicit=allow_explicit)
+        recs = g.engine.get_recommendations_by_features(avg_dna, limit=limit, exclude_names=exclude_names, allow_explicit=allow_explicit, filters=filters)
         if recs:
             return jsonify({
                 "type": "bridge",
@@ -126,11 +556,12 @@ def recommend_mix():
     # Standard Ensemble Logic
     avg_dna = {f: sum([s.get('features', {}).get(f, 0.5) for s in mix_items]) / len(mix_items) for f in features_to_blend}
     
-    recs = engine.get_recommendations_by_features(
+    recs = g.engine.get_recommendations_by_features(
         avg_dna,
         limit=limit,
-        exclude_names=[s.get('name') for s in mix_items],
-        allow_explicit=allow_explicit
+        exclude_names=exclude_names,
+        allow_explicit=allow_explicit,
+        filters=filters
     )
     
     if recs:
@@ -142,6 +573,23 @@ def recommend_mix():
         return jsonify({"error": "Could not find matching tracks"}), 404
 
 
+@app.route('/admin/reload', methods=['POST'])
+def admin_reload():
+    """
+    Starts a hot catalog reload in the background (202); 409 while one is running. Needs
+    `Authorization: Bearer $ADMIN_TOKEN`. Each worker process holds its own engine, so under
+    several workers this reloads only the one that answers; use CATALOG_WATCH_SECONDS there.
+    """
+    if not ADMIN_TOKEN:
+        return jsonify({"error": "Not found"}), 404
+    if not hmac.compare_digest(request.headers.get('Authorization', '').encode(), f"Bearer {ADMIN_TOKEN}".encode()):
+        return jsonify({"error": "Unauthorized"}), 401
+    if engine is None and not engine_error:
+        return _not_ready_response()
+    if _reload_lock.locked():
+        return jsonify({"status": "reloading", "catalog_version": catalog_version()}), 409
+    threading.Thread(target=reload_engine, name='engine-reloader', daemon=True).start()
+    return jsonify({"status": "reloading", "catalog_version": catalog_version()}), 202
 
 if __name__ == '__main__':
     app.run(host='0.0.0.0', debug=True)
\ No newline at end of file
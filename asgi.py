@@ -0,0 +1,178 @@
+"""
+asgi.py — ASGI entry point for the recommender API
+Serves the existing Flask routes (same URLs, same JSON) from an event loop:
+  • cheap routes (/, /healthz, /readyz, /parse_vibe) are answered inline on the loop, so
+    per-keystroke vibe parsing never queues behind a catalog scan;
+  • everything else runs the Flask app on a bounded thread pool, where NumPy releases the
+    GIL for the heavy matrix work. Beyond ENGINE_MAX_PENDING in-flight requests the server
+    answers 503 + Retry-After instead of queueing without bound.
+
+Usage:
+    uvicorn asgi:app --host 0.0.0.0 --port 8000 [--workers N]
+Env: ENGINE_THREADS (pool size, default CPU count), ENGINE_MAX_PENDING (default 8 x threads)
+"""
+import asyncio
+import io
+import json
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+from app import app as flask_app, RETRY_AFTER_SECONDS
+
+INLINE_PATHS = frozenset({'/', '/healthz', '/readyz', '/parse_vibe'})
+ENGINE_THREADS = int(os.environ.get('ENGINE_THREADS', os.cpu_count() or 4))
+ENGINE_MAX_PENDING = int(os.environ.get('ENGINE_MAX_PENDING', ENGINE_THREADS * 8))
+
+_executor = ThreadPoolExecutor(max_workers=ENGINE_THREADS, thread_name_prefix='engine')
+_in_flight = 0  # only touched from the event loop thread
+
+
+def _environ(scope, body):
+    """WSGI environ for an ASGI HTTP scope (PEP 3333 string handling)."""
+    server = scope.get('server') or ('localhost', 80)
+    client = scope.get('client') or ('', 0)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode('utf-8').decode('latin-1'),
+        'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope['query_string'].decode('latin-1'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1]),
+        'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+        'REMOTE_ADDR': client[0],
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': io.BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    for name, value in scope.get('headers', []):
+        name, value = name.decode('latin-1'), value.decode('latin-1')
+        if name == 'content-type':
+            key = 'CONTENT_TYPE'
+        elif name == 'content-length':
+            key = 'CONTENT_LENGTH'
+        else:
+            key = 'HTTP_' + name.upper().replace('-', '_')
+        environ[key] = f"{environ[key]},{value}" if key in environ else value
+    # The body is already fully buffered, chunked or not
+    environ['CONTENT_LENGTH'] = str(len(body))
+    environ.pop('HTTP_TRANSFER_ENCODING', None)
+    return environ
+
+
+def _run_wsgi(environ, emit):
+    """
+    Runs the Flask app on one request, reporting ('start', status, headers), ('body', bytes)
+    and finally ('end',) through `emit`. A streamed response is iterated to completion on
+    the calling thread, since its request context must stay on one thread.
+    """
+    def start_response(status, headers, exc_info=None):
+        emit(('start', int(status.split(' ', 1)[0]),
+              [(k.lower().encode('latin-1'), v.encode('latin-1')) for k, v in headers]))
+
+    result = flask_app(environ, start_response)
+    try:
+        for chunk in result:
+            if chunk:
+                emit(('body', chunk))
+    finally:
+        if hasattr(result, 'close'):
+            result.close()
+    emit(('end',))
+
+
+def _run_offloaded(environ, emit):
+    try:
+        _run_wsgi(environ, emit)
+    except Exception as e:
+        emit(('error', e))
+
+
+async def _read_body(receive):
+    chunks = []
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            break
+        chunks.append(message.get('body', b''))
+        if not message.get('more_body'):
+            break
+    return b''.join(chunks)
+
+
+async def _send_event(send, event):
+    if event[0] == 'start':
+        await send({'type': 'http.response.start', 'status': event[1], 'headers': event[2]})
+    elif event[0] == 'body':
+        await send({'type': 'http.response.body', 'body': event[1], 'more_body': True})
+    else:
+        await send({'type': 'http.response.body', 'body': b'', 'more_body': False})
+
+
+async def _send_busy(send):
+    body = json.dumps({"error": "Server busy, please retry shortly", "status": "busy"}).encode() + b'\n'
+    await send({'type': 'http.response.start', 'status': 503, 'headers': [
+        (b'content-type', b'application/json'),
+        (b'content-length', str(len(body)).encode()),
+        (b'retry-after', str(RETRY_AFTER_SECONDS).encode()),
+    ]})
+    await send({'type': 'http.response.body', 'body': body})
+
+
+async def _lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            _executor.shutdown(wait=False)
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def app(scope, receive, send):
+    global _in_flight
+    if scope['type'] == 'lifespan':
+        return await _lifespan(receive, send)
+    if scope['type'] != 'http':
+        return
+
+    environ = _environ(scope, await _read_body(receive))
+
+    if scope['path'] in INLINE_PATHS:
+        events = []
+        _run_wsgi(environ, events.append)
+        for event in events:
+            await _send_event(send, event)
+        return
+
+    if _in_flight >= ENGINE_MAX_PENDING:
+        return await _send_busy(send)
+
+    _in_flight += 1
+    started = False
+    try:
+        loop = asyncio.get_running_loop()
+        queue = asyncio.Queue()
+        loop.run_in_executor(_executor, _run_offloaded, environ,
+                             lambda event: loop.call_soon_threadsafe(queue.put_nowait, event))
+        while True:
+            event = await queue.get()
+            if event[0] == 'error':
+                raise event[1]
+            started = started or event[0] == 'start'
+            await _send_event(send, event)
+            if event[0] == 'end':
+                break
+    except Exception as e:
+        print(f"❌ ASGI handler error: {e}")
+        if not started:
+            await send({'type': 'http.response.start', 'status': 500,
+                        'headers': [(b'content-type', b'application/json')]})
+            await send({'type': 'http.response.body', 'body': json.dumps({"error": "Internal server error"}).encode()})
+    finally:
+        _in_flight -= 1
@@ -0,0 +1,196 @@
+"""
+batch_recommend.py — Offline batch recommender: JSONL queries in, JSONL recommendations out
+Runs MusicEngine directly (no HTTP) across a process pool. Workers are forked after the
+catalog has loaded, so they share its arrays copy-on-write, and the memory-mapped
+catalog cache / k-NN graph pages once in the page cache for all of them.
+
+One query per input line (any other keys, e.g. "user", are echoed back):
+    {"seed": "Blinding Lights"}                       title search, best match, as /recommend
+    {"seed_id": "0VjIjW4GlUZAMYd2vXMi3b"}             track id
+    {"vibe": "rainy night drive"}                     vibe text, parsed like /parse_vibe
+    {"features": {"energy": 0.8, "valence": 0.3}}     target chart features
+optional per line: "limit" (default 10), "allow_explicit" (default true), "filters" (see catalog_filters.py)
+
+Seed queries in a chunk are scored together in blocked matrix products; output lines keep
+input order and are written as each chunk completes. Progress and throughput go to stderr.
+
+Usage:
+    python batch_recommend.py queries.jsonl -o results.jsonl [--processes N] [--chunk-size 256]
+"""
+import argparse
+import contextlib
+import json
+import multiprocessing
+import os
+import sys
+import time
+
+from model_utils import MusicEngine
+
+QUERY_KEYS = frozenset({'seed', 'seed_id', 'vibe', 'features', 'limit', 'allow_explicit', 'filters', 'invalid'})
+
+_engine = None
+
+
+def _init_worker(data_dir):
+    """Pool initializer: reuses the engine inherited through fork, else loads one (catalog cache -> mmap)."""
+    global _engine
+    # Engine status messages must not interleave with the JSONL results
+    sys.stdout = sys.stderr
+    if _engine is None:
+        _engine = MusicEngine(data_dir=data_dir)
+
+
+def _echo(query, line_no):
+    """Output record skeleton: the input line number plus the caller's own keys."""
+    record = {k: v for k, v in query.items() if k not in QUERY_KEYS}
+    record['line'] = line_no
+    return record
+
+
+def _feature_result(features, query):
+    recs = _engine.get_recommendations_by_features(
+        features, limit=int(query.get('limit', 10)), allow_explicit=query.get('allow_explicit', True),
+        filters=query.get('filters'))
+    return {"recommendations": recs} if recs else {"error": "Could not find matching tracks"}
+
+
+def process_chunk(chunk):
+    """Answers a list of (line number, query) pairs; returns the output records in the same order."""
+    records = [None] * len(chunk)
+    # Seed queries with the same options are scored as one batch
+    seed_groups = {}
+
+    for pos, (line_no, query) in enumerate(chunk):
+        record = records[pos] = _echo(query, line_no)
+        try:
+            if 'invalid' in query:
+                record["error"] = f"Invalid JSON line: {query['invalid']}"
+            elif 'seed_id' in query or 'seed' in query:
+                seed_id = query.get('seed_id')
+                if seed_id is None:
+                    matches = _engine.search_song(str(query['seed']))
+                    if not matches:
+                        record["error"] = f"No match found for '{query['seed']}'"
+                        continue
+                    seed_id = matches[0]['id']
+                options = (int(query.get('limit', 10)), bool(query.get('allow_explicit', True)),
+                           json.dumps(query.get('filters'), sort_keys=True))
+                seed_groups.setdefault(options, []).append((pos, seed_id))
+            elif 'vibe' in query:
+                vibe = _engine.parse_vibe_full(str(query['vibe']))
+                features = (vibe.get('features') if vibe else None) or _engine.resolve_mood(str(query['vibe']))
+                if not features:
+                    record["error"] = "Could not interpret vibe"
+                    continue
+                record.update(_feature_result(features, query))
+                if vibe:
+                    record["vibe_tags"] = vibe.get('tags', [])
+            elif 'features' in query:
+                record.update(_feature_result(query['features'], query))
+            else:
+                record["error"] = "Query needs one of: seed, seed_id, vibe, features"
+        except (ValueError, TypeError, AttributeError) as e:
+            record["error"] = str(e)
+
+    for (limit, allow_explicit, filters), items in seed_groups.items():
+        try:
+            results = _engine.get_recommendations_batch(seed_ids=[seed_id for _, seed_id in items], limit=limit,
+                                                        allow_explicit=allow_explicit, filters=json.loads(filters))
+        except ValueError as e:
+            results = [{"error": str(e)}] * len(items)
+        for (pos, seed_id), result in zip(items, results):
+            records[pos].update(result or {"error": f"Unknown track id '{seed_id}'"})
+    return records
+
+
+def _read_chunks(path, chunk_size):
+    """Yields lists of (line number, query); unparseable lines become queries that report the error."""
+    chunk = []
+    with (sys.stdin if path == '-' else open(path)) as f:
+        for line_no, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            try:
+                query = json.loads(line)
+                if not isinstance(query, dict):
+                    raise ValueError("not an object")
+            except ValueError as e:
+                query = {"invalid": str(e)}
+            chunk.append((line_no, query))
+            if len(chunk) == chunk_size:
+                yield chunk
+                chunk = []
+    if chunk:
+        yield chunk
+
+
+def run(input_path, output, processes=None, chunk_size=256, data_dir=None, progress_every=5.0):
+    """Streams answers for every query in `input_path` to the `output` file object; returns run stats."""
+    processes = processes or os.cpu_count() or 1
+    started = time.perf_counter()
+    done = errors = 0
+
+    with contextlib.ExitStack() as stack:
+        # Engine status messages go to stderr; `output` may be stdout
+        stack.enter_context(contextlib.redirect_stdout(sys.stderr))
+
+        # Load once here; forked workers inherit the engine instead of each loading their own
+        ctx = multiprocessing.get_context('fork' if 'fork' in multiprocessing.get_all_start_methods() else None)
+        if processes == 1 or ctx.get_start_method() == 'fork':
+            _init_worker(data_dir)
+        load_seconds = time.perf_counter() - started
+
+        chunks = _read_chunks(input_path, chunk_size)
+        if processes > 1:
+            pool = stack.enter_context(ctx.Pool(processes, initializer=_init_worker, initargs=(data_dir,)))
+            results = pool.imap(process_chunk, chunks)
+        else:
+            results = map(process_chunk, chunks)
+
+        last_report = time.perf_counter()
+        for records in results:
+            for record in records:
+                output.write(json.dumps(record) + "\n")
+                errors += "error" in record
+            done += len(records)
+            now = time.perf_counter()
+            if now - last_report >= progress_every:
+                last_report = now
+                rate = done / (now - started - load_seconds)
+                print(f"   {done} queries ({rate:,.0f} queries/s)", file=sys.stderr)
+    output.flush()
+
+    elapsed = time.perf_counter() - started - load_seconds
+    return {
+        "queries": done,
+        "errors": errors,
+        "processes": processes,
+        "load_seconds": round(load_seconds, 2),
+        "seconds": round(elapsed, 2),
+        "queries_per_second": round(done / elapsed, 1) if elapsed > 0 else 0.0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Batch recommendations from a JSONL file of seeds / vibes.")
+    parser.add_argument('input', help="JSONL queries ('-' for stdin)")
+    parser.add_argument('-o', '--output', default='-', help="JSONL results (default: stdout)")
+    parser.add_argument('--processes', type=int, default=None, help="Worker processes (default: CPU count)")
+    parser.add_argument('--chunk-size', type=int, default=256, help="Queries per work unit / scoring batch")
+    parser.add_argument('--data-dir', default=None, help="Directory holding spotify_tracks.csv (default: $MUSIC_DATA_DIR, else the app directory)")
+    args = parser.parse_args()
+
+    output = sys.stdout if args.output == '-' else open(args.output, 'w')
+    try:
+        stats = run(args.input, output, args.processes, args.chunk_size, args.data_dir)
+    finally:
+        if output is not sys.stdout:
+            output.close()
+    print(f"✅ {stats['queries']} queries ({stats['errors']} errors) in {stats['seconds']}s "
+          f"on {stats['processes']} processes: {stats['queries_per_second']} queries/s "
+          f"(catalog load {stats['load_seconds']}s)", file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
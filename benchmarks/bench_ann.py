@@ -0,0 +1,48 @@
+"""
+bench_ann.py — Recall@k and latency of the IVF-flat embedding index against brute force.
+
+    python benchmarks/bench_ann.py --tracks 1000000 --queries 200 --nprobe 8 16 32
+"""
+import argparse
+import time
+
+import numpy as np
+
+from synthetic import make_catalog
+from ann_index import ExactIndex, IVFFlatIndex
+from model_utils import HEURISTIC_POOL, _l2_normalize
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--tracks", type=int, default=1_000_000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=HEURISTIC_POOL)
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[8, 16, 32])
+    args = parser.parse_args()
+
+    _, embeddings = make_catalog(args.tracks)
+    vectors = _l2_normalize(embeddings)
+    queries = vectors[np.random.default_rng(1).choice(args.tracks, args.queries, replace=False)]
+
+    start = time.perf_counter()
+    ivf = IVFFlatIndex.build(vectors)
+    print(f"tracks={args.tracks}  lists={ivf.centroids.shape[0]}  build={time.perf_counter() - start:.1f}s")
+
+    exact = ExactIndex(vectors)
+    start = time.perf_counter()
+    truth = [exact.search(q, args.k)[0] for q in queries]
+    exact_ms = (time.perf_counter() - start) / args.queries * 1000
+    print(f"exact           : {exact_ms:8.3f} ms/query  recall@{args.k}=1.000")
+
+    for nprobe in args.nprobe:
+        ivf.nprobe = nprobe
+        start = time.perf_counter()
+        found = [ivf.search(q, args.k)[0] for q in queries]
+        ivf_ms = (time.perf_counter() - start) / args.queries * 1000
+        recall = np.mean([len(np.intersect1d(t, f)) / len(t) for t, f in zip(truth, found)])
+        print(f"ivf nprobe={nprobe:<4}: {ivf_ms:8.3f} ms/query  recall@{args.k}={recall:.3f}")
+
+
+if __name__ == "__main__":
+    main()
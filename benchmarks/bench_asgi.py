@@ -0,0 +1,140 @@
+"""
+bench_asgi.py — /parse_vibe latency under concurrent /recommend load:
+gunicorn sync workers (app:app) vs. the ASGI entry point under uvicorn (asgi:app).
+
+A pool of client threads keeps /recommend busy (exact full-catalog scans) while one probe
+sends a /parse_vibe request every few milliseconds; the probe's p50/p99 is what a user
+typing into the vibe box experiences. Same worker count in both modes.
+
+    python benchmarks/bench_asgi.py --tracks 300000 --workers 1 --concurrency 8 --duration 15
+"""
+import argparse
+import os
+import pickle
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.parse
+import urllib.request
+
+import numpy as np
+
+from synthetic import make_catalog
+from bench_nlp import load_golden
+from bench_workers import REPO_ROOT, _free_port, _post
+
+SERVERS = {
+    "sync": lambda port, workers: [sys.executable, "-m", "gunicorn", "-w", str(workers), "-b", f"127.0.0.1:{port}",
+                                   "--timeout", "600", "app:app"],
+    "asgi": lambda port, workers: [sys.executable, "-m", "uvicorn", "asgi:app", "--host", "127.0.0.1",
+                                   "--port", str(port), "--workers", str(workers), "--log-level", "warning"],
+}
+
+
+def _get(port, path):
+    with urllib.request.urlopen(f"http://127.0.0.1:{port}{path}", timeout=60) as resp:
+        return resp.status, resp.read()
+
+
+def _wait_ready(port, proc, timeout=600):
+    deadline = time.time() + timeout
+    while True:
+        try:
+            if _get(port, "/readyz")[0] == 200:
+                return
+        except Exception:
+            pass
+        if time.time() > deadline or proc.poll() is not None:
+            raise RuntimeError("server did not become ready")
+        time.sleep(0.5)
+
+
+def run_mode(mode, data_dir, args, seeds, phrases):
+    port = _free_port()
+    env = dict(os.environ, MUSIC_DATA_DIR=data_dir, ANN_INDEX="exact")
+    proc = subprocess.Popen(SERVERS[mode](port, args.workers), cwd=REPO_ROOT, env=env,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        _wait_ready(port, proc)
+        stop = threading.Event()
+        recommend_latencies = []
+
+        def load(worker):
+            i = worker
+            while not stop.is_set():
+                started = time.perf_counter()
+                try:
+                    _post(port, "/recommend", {"song_name": seeds[i % len(seeds)], "limit": 10})
+                    recommend_latencies.append(time.perf_counter() - started)
+                except Exception:
+                    pass
+                i += args.concurrency
+
+        threads = [threading.Thread(target=load, args=(w,), daemon=True) for w in range(args.concurrency)]
+        for t in threads:
+            t.start()
+        time.sleep(1.0)  # let the load reach steady state
+
+        vibe_latencies = []
+        deadline = time.time() + args.duration
+        i = 0
+        while time.time() < deadline:
+            started = time.perf_counter()
+            _get(port, "/parse_vibe?q=" + urllib.parse.quote(phrases[i % len(phrases)]))
+            vibe_latencies.append(time.perf_counter() - started)
+            i += 1
+            time.sleep(args.interval / 1000)
+
+        stop.set()
+        for t in threads:
+            t.join()
+
+        vibe_ms = np.array(vibe_latencies) * 1e3
+        return {
+            "parse_vibe_p50_ms": float(np.percentile(vibe_ms, 50)),
+            "parse_vibe_p99_ms": float(np.percentile(vibe_ms, 99)),
+            "parse_vibe_requests": len(vibe_ms),
+            "recommend_rps": len(recommend_latencies) / (args.duration + 1.0),
+        }
+    finally:
+        proc.terminate()
+        proc.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--tracks", type=int, default=300_000)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--concurrency", type=int, default=8, help="concurrent /recommend clients")
+    parser.add_argument("--duration", type=float, default=15.0, help="seconds of /parse_vibe probing per mode")
+    parser.add_argument("--interval", type=float, default=20.0, help="ms between /parse_vibe probes")
+    args = parser.parse_args()
+
+    sys.path.insert(0, REPO_ROOT)
+    from model_utils import MusicEngine
+
+    phrases = [g["text"] for g in load_golden()]
+    data_dir = tempfile.mkdtemp()
+    try:
+        df, embeddings = make_catalog(args.tracks)
+        seeds = df["track_name"].sample(200, random_state=0).tolist()
+        df.drop(columns=["search_str"]).to_csv(os.path.join(data_dir, "spotify_tracks.csv"), index=False)
+        with open(os.path.join(data_dir, "song_embeddings.pkl"), "wb") as f:
+            pickle.dump(embeddings, f)
+        del df, embeddings
+        MusicEngine.build_catalog_cache(data_dir)
+
+        print(f"tracks={args.tracks} workers={args.workers} recommend clients={args.concurrency}")
+        for mode in SERVERS:
+            r = run_mode(mode, data_dir, args, seeds, phrases)
+            print(f"{mode:<5} /parse_vibe p50 {r['parse_vibe_p50_ms']:7.2f} ms   p99 {r['parse_vibe_p99_ms']:8.2f} ms   "
+                  f"({r['parse_vibe_requests']} probes)   /recommend {r['recommend_rps']:6.1f} req/s")
+    finally:
+        shutil.rmtree(data_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
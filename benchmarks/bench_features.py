@@ -0,0 +1,62 @@
+"""
+bench_features.py — Feature-query latency: precomputed normalized matrix vs. per-call cosine_similarity.
+
+    python benchmarks/bench_features.py --tracks 200000 --repeat 20
+"""
+import argparse
+import time
+
+import numpy as np
+from sklearn.metrics.pairwise import cosine_similarity
+
+from synthetic import make_engine
+from ann_index import top_k
+from model_utils import CHART_FEATURES, HEURISTIC_POOL, _l2_normalize
+
+
+def legacy_candidates(engine, target):
+    """The pre-index path: rebuild the matrix, score everything, full argsort."""
+    vector = np.array([target.get(f, 0.5) for f in CHART_FEATURES]).reshape(1, -1)
+    scores = cosine_similarity(vector, engine.df[CHART_FEATURES].values).flatten()
+    return scores.argsort()[::-1][:HEURISTIC_POOL]
+
+
+def indexed_candidates(engine, target):
+    vector = _l2_normalize([target.get(f, 0.5) for f in CHART_FEATURES])
+    return top_k(engine.feature_matrix @ vector, HEURISTIC_POOL)
+
+
+def timed(fn, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start) / repeat * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--tracks", type=int, default=200_000)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    engine = make_engine(args.tracks)
+    rng = np.random.default_rng(1)
+    targets = [dict(zip(CHART_FEATURES, rng.random(len(CHART_FEATURES)))) for _ in range(args.repeat)]
+
+    # Rankings must agree; float32 vs float64 scoring can only swap near-exact ties
+    pairs = [(legacy_candidates(engine, t), indexed_candidates(engine, t)) for t in targets]
+    overlap = np.mean([len(np.intersect1d(a, b)) / HEURISTIC_POOL for a, b in pairs])
+    same_order = np.mean([np.array_equal(a, b) for a, b in pairs])
+
+    legacy_ms = timed(lambda: [legacy_candidates(engine, t) for t in targets], 1) / len(targets)
+    indexed_ms = timed(lambda: [indexed_candidates(engine, t) for t in targets], 1) / len(targets)
+    full_ms = timed(lambda: [engine.get_recommendations_by_features(t, limit=10) for t in targets], 1) / len(targets)
+
+    print(f"tracks={args.tracks}  top-{HEURISTIC_POOL} overlap={overlap:.4f}  identical order={same_order:.0%}")
+    print(f"legacy   scoring: {legacy_ms:8.2f} ms/query")
+    print(f"indexed  scoring: {indexed_ms:8.2f} ms/query  ({legacy_ms / indexed_ms:.1f}x)")
+    print(f"get_recommendations_by_features end-to-end: {full_ms:8.2f} ms/query")
+
+
+if __name__ == "__main__":
+    main()
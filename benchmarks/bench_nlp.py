@@ -0,0 +1,54 @@
+"""
+bench_nlp.py — parse_vibe golden-output check and throughput (parses/sec).
+
+data/vibe_golden.jsonl holds outputs recorded from the original term-by-term parser;
+every phrase must still parse identically before the throughput is reported.
+
+    python benchmarks/bench_nlp.py --rounds 20
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from nlp_engine import parse_vibe
+
+GOLDEN_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "vibe_golden.jsonl")
+
+
+def load_golden(path=GOLDEN_PATH):
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def check_golden(golden):
+    """Returns the phrases whose parse differs from the recorded output."""
+    return [g["text"] for g in golden if parse_vibe(g["text"]) != g["result"]]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rounds", type=int, default=20)
+    args = parser.parse_args()
+
+    golden = load_golden()
+    mismatches = check_golden(golden)
+    if mismatches:
+        print(f"❌ {len(mismatches)}/{len(golden)} phrases differ from the golden output, e.g. {mismatches[:3]}")
+        sys.exit(1)
+    print(f"✅ golden output: {len(golden)} phrases identical")
+
+    phrases = [g["text"] for g in golden]
+    start = time.perf_counter()
+    for _ in range(args.rounds):
+        for text in phrases:
+            parse_vibe(text)
+    elapsed = time.perf_counter() - start
+    print(f"throughput: {args.rounds * len(phrases) / elapsed:,.0f} parses/sec")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""
+bench_search.py — search_song latency and top-5 agreement: trigram index vs. full rapidfuzz scan.
+
+    python benchmarks/bench_search.py --tracks 200000 --queries 100
+"""
+import argparse
+import time
+
+import numpy as np
+from rapidfuzz import process, fuzz
+
+from synthetic import make_catalog
+from search_index import SearchIndex
+
+
+def make_queries(df, n, seed=1):
+    """Mix of the query shapes the search box sees: full titles, fragments, artists, typos."""
+    rng = np.random.default_rng(seed)
+    titles = df['track_name'].astype(str).to_numpy()
+    artists = df['artists'].astype(str).str.strip("[]'").to_numpy()
+    queries = []
+    for i in range(n):
+        title = titles[rng.integers(len(titles))]
+        kind = i % 4
+        if kind == 0:
+            queries.append(title)
+        elif kind == 1:
+            queries.append(title.split()[0] + " " + title.split()[1])
+        elif kind == 2:
+            queries.append(artists[rng.integers(len(artists))])
+        else:
+            pos = rng.integers(1, len(title) - 1)
+            queries.append(title[:pos] + title[pos + 1:])
+    return queries
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--tracks", type=int, default=200_000)
+    parser.add_argument("--queries", type=int, default=100)
+    args = parser.parse_args()
+
+    df, _ = make_catalog(args.tracks)
+    choices = df['search_str'].tolist()
+
+    start = time.perf_counter()
+    index = SearchIndex(choices)
+    print(f"tracks={args.tracks}  build={time.perf_counter() - start:.2f}s  trigrams={len(index.gram_ids)}")
+
+    queries = make_queries(df, args.queries)
+
+    start = time.perf_counter()
+    legacy = [process.extract(q, df['search_str'].tolist(), limit=5, scorer=fuzz.partial_ratio) for q in queries]
+    legacy_ms = (time.perf_counter() - start) / len(queries) * 1000
+
+    start = time.perf_counter()
+    indexed = [index.search(q, limit=5) for q in queries]
+    indexed_ms = (time.perf_counter() - start) / len(queries) * 1000
+
+    same = np.mean([[m[2] for m in a] == [m[2] for m in b] for a, b in zip(legacy, indexed)])
+    same_best = np.mean([a[0][2] == b[0][2] for a, b in zip(legacy, indexed)])
+    print(f"legacy full scan: {legacy_ms:8.2f} ms/query")
+    print(f"trigram index   : {indexed_ms:8.2f} ms/query  ({legacy_ms / indexed_ms:.1f}x)")
+    print(f"identical top-5 : {same:.1%}  (top-1: {same_best:.1%})")
+
+
+if __name__ == "__main__":
+    main()
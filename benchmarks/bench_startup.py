@@ -0,0 +1,64 @@
+"""
+bench_startup.py — Engine cold-start time and peak RSS: CSV + PKL vs. the binary columnar cache.
+
+Each measurement runs in a fresh interpreter so peak RSS reflects a single worker.
+
+    python benchmarks/bench_startup.py --tracks 500000
+"""
+import argparse
+import json
+import os
+import pickle
+import subprocess
+import sys
+import tempfile
+
+from synthetic import make_catalog
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Peak RSS comes from VmHWM: ru_maxrss survives exec and would report the (large) parent's peak
+_CHILD = """
+import json, sys, time
+sys.path.insert(0, {root!r})
+start = time.perf_counter()
+from model_utils import MusicEngine
+engine = MusicEngine(data_dir={data_dir!r})
+elapsed = time.perf_counter() - start
+with open('/proc/self/status') as f:
+    hwm_kb = next(int(line.split()[1]) for line in f if line.startswith('VmHWM'))
+print(json.dumps({{"seconds": elapsed, "peak_rss_mb": hwm_kb / 1024, "rows": len(engine.df)}}))
+"""
+
+
+def measure(data_dir):
+    out = subprocess.run([sys.executable, "-c", _CHILD.format(root=REPO_ROOT, data_dir=data_dir)],
+                         capture_output=True, text=True, check=True).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--tracks", type=int, default=500_000)
+    args = parser.parse_args()
+
+    sys.path.insert(0, REPO_ROOT)
+    from model_utils import MusicEngine
+
+    with tempfile.TemporaryDirectory() as data_dir:
+        df, embeddings = make_catalog(args.tracks)
+        df.drop(columns=["search_str"]).to_csv(os.path.join(data_dir, "spotify_tracks.csv"), index=False)
+        with open(os.path.join(data_dir, "song_embeddings.pkl"), "wb") as f:
+            pickle.dump(embeddings, f)
+
+        csv_run = measure(data_dir)
+        MusicEngine.build_catalog_cache(data_dir)
+        cache_run = measure(data_dir)
+
+    print(f"tracks={args.tracks}")
+    print(f"CSV + PKL     : {csv_run['seconds']:6.2f} s  peak RSS {csv_run['peak_rss_mb']:7.1f} MB")
+    print(f"binary cache  : {cache_run['seconds']:6.2f} s  peak RSS {cache_run['peak_rss_mb']:7.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,189 @@
+"""
+bench_suite.py — Latency of every engine hot path on synthetic 10k / 100k / 1M catalogs,
+with JSON output and a compare mode that flags regressions between two runs.
+
+Timed per catalog size (each call gets a fresh input, so result caches do not flatter it):
+    search_song, get_recommendations, get_recommendations_by_features,
+    get_bridge_recommendation, parse_vibe, and Flask test-client round trips of
+    POST /recommend (plain and with a year filter), GET /parse_vibe and POST /recommend_mix.
+Every HTTP case must answer 200 on its first input, or the run stops.
+
+    python benchmarks/bench_suite.py --sizes 10000 100000 1000000 -o results.json
+    python benchmarks/bench_suite.py --compare baseline.json results.json --threshold 0.15
+
+Compare mode matches cases by (size, name), reports the median ratio of each and exits
+with status 1 when any case is slower than baseline by more than the threshold.
+"""
+import argparse
+import contextlib
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+from synthetic import make_engine
+from bench_nlp import load_golden
+from model_utils import CHART_FEATURES
+
+DEFAULT_SIZES = (10_000, 100_000, 1_000_000)
+
+
+def measure(fn, inputs, warmup=3):
+    """Calls fn(x) for each input; returns latency stats in milliseconds."""
+    for x in inputs[:warmup]:
+        fn(x)
+    samples = []
+    for x in inputs:
+        started = time.perf_counter()
+        fn(x)
+        samples.append(time.perf_counter() - started)
+    ms = np.array(samples) * 1e3
+    return {
+        "iterations": len(ms),
+        "median_ms": round(float(np.median(ms)), 4),
+        "p95_ms": round(float(np.percentile(ms, 95)), 4),
+        "mean_ms": round(float(ms.mean()), 4),
+    }
+
+
+def bench_size(n, iterations, seed=1):
+    """Runs every case on one synthetic catalog of `n` tracks; returns [result dicts]."""
+    import app as app_module
+    import nlp_engine
+
+    started = time.perf_counter()
+    engine = make_engine(n)
+    build_seconds = time.perf_counter() - started
+    app_module.engine = engine
+    client = app_module.app.test_client()
+
+    rng = np.random.default_rng(seed)
+    rows = rng.integers(0, n, size=(iterations, 2))
+    names = engine.df['track_name'].to_numpy()
+    ids = engine.df['id'].to_numpy()
+    targets = [dict(zip(CHART_FEATURES, rng.random(len(CHART_FEATURES)).tolist())) for _ in range(iterations)]
+    phrases = [g["text"] for g in load_golden()]
+    phrases = [phrases[i % len(phrases)] for i in rng.permutation(max(iterations, len(phrases)))[:iterations]]
+    # Partial titles, the way users type them
+    queries = [" ".join(str(names[a]).split()[:2]) + " " + str(names[a]).split()[-1][:3] for a, _ in rows]
+
+    cases = {
+        "search_song": (lambda q: engine.search_song(q), queries),
+        "get_recommendations": (lambda r: engine.get_recommendations(seed_id=ids[r[0]], limit=10), rows),
+        "get_recommendations_by_features": (lambda t: engine.get_recommendations_by_features(t, limit=10), targets),
+        "get_bridge_recommendation": (
+            lambda r: engine.get_bridge_recommendation(song_a_id=ids[r[0]], song_b_id=ids[r[1]], limit=5), rows),
+        "parse_vibe": (nlp_engine.parse_vibe, phrases),
+        "http_recommend": (
+            lambda r: client.post('/recommend', json={"song_name": str(names[r[0]]), "limit": 10}), rows),
+        "http_recommend_filtered": (
+            lambda r: client.post('/recommend', json={"song_name": str(names[r[0]]), "limit": 10,
+                                                      "filters": {"year": [1990, 2009]}}), rows),
+        "http_parse_vibe": (lambda p: client.get('/parse_vibe', query_string={"q": p}), phrases),
+        "http_recommend_mix": (
+            lambda t: client.post('/recommend_mix', json={"songs": [{"name": "a", "features": t},
+                                                                    {"name": "b", "features": {}},
+                                                                    {"name": "c", "features": t}],
+                                                          "limit": 5}), targets),
+    }
+
+    # A failing endpoint would otherwise be timed as a fast one
+    for name, (fn, inputs) in cases.items():
+        if name.startswith("http_"):
+            status = fn(list(inputs)[0]).status_code
+            if status != 200:
+                raise RuntimeError(f"{name} answered HTTP {status}")
+
+    results = [{"size": n, "name": "engine_build", "iterations": 1, "median_ms": round(build_seconds * 1e3, 1),
+                "p95_ms": round(build_seconds * 1e3, 1), "mean_ms": round(build_seconds * 1e3, 1)}]
+    for name, (fn, inputs) in cases.items():
+        engine.invalidate_caches()
+        results.append({"size": n, "name": name, **measure(fn, list(inputs))})
+    app_module.engine = None
+    return results
+
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def run(sizes, iterations):
+    meta = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "git_commit": _git_commit(),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "ann_index": os.environ.get('ANN_INDEX', 'auto'),
+    }
+    results = []
+    for n in sizes:
+        size_results = bench_size(n, iterations)
+        for r in size_results:
+            print(f"{r['size']:>9} {r['name']:<34} median {r['median_ms']:10.3f} ms   p95 {r['p95_ms']:10.3f} ms",
+                  file=sys.stderr)
+        results.extend(size_results)
+    return {"meta": meta, "results": results}
+
+
+def compare(baseline, current, threshold):
+    """Returns (rows, regressions): per-case median ratios current/baseline."""
+    base = {(r["size"], r["name"]): r for r in baseline["results"]}
+    rows, regressions = [], []
+    for r in current["results"]:
+        b = base.get((r["size"], r["name"]))
+        if b is None or r["name"] == "engine_build":
+            continue
+        ratio = r["median_ms"] / b["median_ms"] if b["median_ms"] > 0 else float("inf")
+        row = {"size": r["size"], "name": r["name"], "baseline_ms": b["median_ms"], "current_ms": r["median_ms"],
+               "ratio": round(ratio, 3), "regression": ratio > 1 + threshold}
+        rows.append(row)
+        if row["regression"]:
+            regressions.append(row)
+    return rows, regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=list(DEFAULT_SIZES))
+    parser.add_argument("--iterations", type=int, default=100, help="calls per case and size")
+    parser.add_argument("-o", "--output", default=None, help="write JSON results here (default: stdout)")
+    parser.add_argument("--compare", nargs=2, metavar=("BASELINE", "CURRENT"), help="compare two result files")
+    parser.add_argument("--threshold", type=float, default=0.15, help="allowed median slowdown (0.15 = 15%%)")
+    args = parser.parse_args()
+
+    if args.compare:
+        with open(args.compare[0]) as f:
+            baseline = json.load(f)
+        with open(args.compare[1]) as f:
+            current = json.load(f)
+        rows, regressions = compare(baseline, current, args.threshold)
+        for row in rows:
+            flag = "REGRESSION" if row["regression"] else ""
+            print(f"{row['size']:>9} {row['name']:<34} {row['baseline_ms']:10.3f} -> {row['current_ms']:10.3f} ms "
+                  f"x{row['ratio']:<6} {flag}", file=sys.stderr)
+        print(json.dumps({"threshold": args.threshold, "cases": rows, "regressions": len(regressions)}, indent=1))
+        sys.exit(1 if regressions else 0)
+
+    # Engine load messages go to stderr so stdout stays pure JSON
+    with contextlib.redirect_stdout(sys.stderr):
+        report = run(args.sizes, args.iterations)
+    payload = json.dumps(report, indent=1)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(payload + "\n")
+    else:
+        print(payload)
+
+
+if __name__ == "__main__":
+    main()
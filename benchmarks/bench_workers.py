@@ -0,0 +1,131 @@
+"""
+bench_workers.py — Per-worker memory under gunicorn with 1, 4 and 8 workers:
+private in-memory arrays (CSV + PKL load) vs. memory-mapped catalog cache.
+
+RSS counts shared pages in every worker; PSS splits them between the processes that map
+them, so the PSS total is the physical memory the whole server really uses. Linux only.
+
+    python benchmarks/bench_workers.py --tracks 300000 --workers 1 4 8
+"""
+import argparse
+import json
+import os
+import pickle
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+from synthetic import make_catalog
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _children(pid):
+    kids = []
+    for entry in os.listdir("/proc"):
+        if entry.isdigit():
+            try:
+                with open(f"/proc/{entry}/stat") as f:
+                    if int(f.read().rsplit(")", 1)[1].split()[1]) == pid:
+                        kids.append(int(entry))
+            except (OSError, IndexError, ValueError):
+                continue
+    return kids
+
+
+def _memory_kb(pid):
+    """(Rss, Pss) in kB from smaps_rollup."""
+    values = {}
+    with open(f"/proc/{pid}/smaps_rollup") as f:
+        for line in f:
+            parts = line.split()
+            if parts[0] in ("Rss:", "Pss:"):
+                values[parts[0][:-1]] = int(parts[1])
+    return values["Rss"], values["Pss"]
+
+
+def _post(port, path, payload):
+    req = urllib.request.Request(f"http://127.0.0.1:{port}{path}", data=json.dumps(payload).encode(),
+                                 headers={"Content-Type": "application/json"})
+    with urllib.request.urlopen(req, timeout=60) as resp:
+        return resp.read()
+
+
+def run_server(data_dir, workers, seeds, timeout=600):
+    port = _free_port()
+    env = dict(os.environ, MUSIC_DATA_DIR=data_dir, ANN_INDEX="exact")
+    proc = subprocess.Popen([sys.executable, "-m", "gunicorn", "-w", str(workers), "-b", f"127.0.0.1:{port}",
+                             "--timeout", str(timeout), "app:app"],
+                            cwd=REPO_ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        deadline = time.time() + timeout
+        while True:
+            try:
+                _post(port, "/recommend", {"song_name": seeds[0], "limit": 5})
+                break
+            except Exception:
+                if time.time() > deadline or proc.poll() is not None:
+                    raise RuntimeError("gunicorn did not come up")
+                time.sleep(0.5)
+
+        # Exact scoring reads the whole embedding table, so every serving worker touches all of it
+        for i in range(workers * 8):
+            _post(port, "/recommend", {"song_name": seeds[i % len(seeds)], "limit": 5})
+
+        pids = _children(proc.pid)
+        samples = [_memory_kb(pid) for pid in pids]
+        return {
+            "workers": len(pids),
+            "rss_mb_per_worker": sum(r for r, _ in samples) / len(samples) / 1024,
+            "pss_mb_total": sum(p for _, p in samples) / 1024,
+        }
+    finally:
+        proc.terminate()
+        proc.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--tracks", type=int, default=300_000)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 4, 8])
+    args = parser.parse_args()
+
+    sys.path.insert(0, REPO_ROOT)
+    from model_utils import MusicEngine
+    from catalog_store import CACHE_DIR_NAME
+
+    data_dir = tempfile.mkdtemp()
+    try:
+        df, embeddings = make_catalog(args.tracks)
+        seeds = df["track_name"].head(50).tolist()
+        df.drop(columns=["search_str"]).to_csv(os.path.join(data_dir, "spotify_tracks.csv"), index=False)
+        with open(os.path.join(data_dir, "song_embeddings.pkl"), "wb") as f:
+            pickle.dump(embeddings, f)
+        del df, embeddings
+
+        print(f"tracks={args.tracks}")
+        for mode in ("csv", "mmap"):
+            if mode == "mmap":
+                MusicEngine.build_catalog_cache(data_dir)
+            else:
+                shutil.rmtree(os.path.join(data_dir, CACHE_DIR_NAME), ignore_errors=True)
+            for workers in args.workers:
+                r = run_server(data_dir, workers, seeds)
+                print(f"{mode:<5} workers={r['workers']}: RSS/worker {r['rss_mb_per_worker']:7.1f} MB   "
+                      f"PSS total {r['pss_mb_total']:7.1f} MB")
+    finally:
+        shutil.rmtree(data_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+"""
+synthetic.py — Random catalogs shaped like spotify_tracks.csv + song_embeddings.pkl
+Lets the benchmarks run without the real dataset.
+"""
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+# Make the repo root importable when running `python benchmarks/<script>.py`
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+EMBEDDING_DIM = 32
+
+
+def make_catalog(n_tracks, embedding_dim=EMBEDDING_DIM, seed=0):
+    """Returns a (DataFrame, embeddings) pair with the same columns and dtypes the engine loads."""
+    rng = np.random.default_rng(seed)
+    n_artists = max(1, n_tracks // 8)
+    artist_ids = rng.integers(0, n_artists, size=n_tracks)
+    words = np.array(["love", "night", "fire", "dream", "blue", "heart", "city", "rain",
+                      "gold", "ghost", "summer", "echo", "wild", "neon", "home", "river"])
+    title_words = rng.choice(words, size=(n_tracks, 2))
+
+    df = pd.DataFrame({
+        "id": [f"trk{i:07d}" for i in range(n_tracks)],
+        "track_name": [f"{a.title()} {b} {i}" for i, (a, b) in enumerate(title_words)],
+        "artists": [f"['Artist {a}']" for a in artist_ids],
+        "explicit": rng.random(n_tracks) < 0.2,
+        "danceability": rng.random(n_tracks, dtype=np.float32),
+        "energy": rng.random(n_tracks, dtype=np.float32),
+        "speechiness": (rng.random(n_tracks, dtype=np.float32) ** 3),
+        "acousticness": rng.random(n_tracks, dtype=np.float32),
+        "instrumentalness": (rng.random(n_tracks, dtype=np.float32) ** 4),
+        "valence": rng.random(n_tracks, dtype=np.float32),
+        "tempo": rng.uniform(60, 190, n_tracks).astype(np.float32),
+        "duration_ms": rng.integers(60000, 480000, n_tracks).astype(np.int32),
+        "year": rng.integers(1960, 2024, n_tracks).astype(np.int16),
+    })
+    df["search_str"] = df["track_name"].astype(str) + " " + df["artists"].astype(str)
+    # Real embeddings cluster by style; a Gaussian mixture keeps ANN recall numbers meaningful
+    n_styles = max(1, int(np.sqrt(n_tracks)))
+    centers = rng.standard_normal((n_styles, embedding_dim)).astype(np.float32)
+    noise = rng.standard_normal((n_tracks, embedding_dim)).astype(np.float32)
+    embeddings = centers[rng.integers(0, n_styles, n_tracks)] + 0.6 * noise
+    return df, embeddings
+
+
+def make_engine(n_tracks, embedding_dim=EMBEDDING_DIM, seed=0):
+    """Builds a MusicEngine over a synthetic catalog."""
+    from model_utils import MusicEngine
+    df, embeddings = make_catalog(n_tracks, embedding_dim, seed)
+    return MusicEngine(df=df, embeddings=embeddings)
@@ -0,0 +1,173 @@
+"""
+catalog_delta.py — Append-only delta segments on top of the base catalog
+New releases are written as small segments instead of rewriting spotify_tracks.csv and
+song_embeddings.pkl. A segment stores its track rows together with their embedding rows
+(in the catalog_store layout), so the two can never drift out of line. MusicEngine merges
+the segments after the base catalog at load time, and compaction folds them back into
+the base files once they pile up.
+
+Layout of the delta directory (next to spotify_tracks.csv, as catalog_delta/):
+    seg-000001/        catalog_store layout: manifest.json, <col>.npy, embeddings.npy, feature_matrix.npy
+    seg-000002/        ... merged in sequence order, after the base rows
+    .incoming-<pid>/   a segment being written (ignored until renamed into place)
+    compacting.json    a compaction in progress: its fully written base files and folded segments
+
+A track id already present in the base catalog or an earlier segment is skipped at merge time.
+Compaction writes the new base files under temporary names, records them in compacting.json and
+only then moves them into place and removes the segments; a load that finds the marker (i.e. an
+interrupted compaction) finishes those steps first, so the base files and segments always agree.
+
+Usage:
+    python catalog_delta.py append new_tracks.csv [new_embeddings.pkl] [--data-dir DIR]
+    python catalog_delta.py compact [--data-dir DIR]
+"""
+import json
+import os
+import shutil
+
+import numpy as np
+
+import catalog_store
+
+DELTA_DIR_NAME = 'catalog_delta'
+SEGMENT_PREFIX = 'seg-'
+COMPACTION_MARKER = 'compacting.json'
+
+
+def segment_dirs(delta_dir):
+    """Complete segments in `delta_dir`, in sequence order."""
+    if not os.path.isdir(delta_dir):
+        return []
+    names = sorted(n for n in os.listdir(delta_dir) if n.startswith(SEGMENT_PREFIX))
+    return [os.path.join(delta_dir, n) for n in names if os.path.exists(os.path.join(delta_dir, n, 'manifest.json'))]
+
+
+def segment_manifests(delta_dir):
+    """Manifest paths of the complete segments (what a source version stamp should cover)."""
+    return [os.path.join(d, 'manifest.json') for d in segment_dirs(delta_dir)]
+
+
+def segment_ids(delta_dir):
+    """Track ids stored in the segments on disk (including ones not yet loaded by any engine)."""
+    ids = set()
+    for seg_dir in segment_dirs(delta_dir):
+        df, _ = catalog_store.read_catalog(seg_dir)
+        ids.update(df['id'].astype(str))
+    return ids
+
+
+def write_segment(delta_dir, df, embeddings=None, feature_matrix=None):
+    """
+    Writes one segment (`embeddings` raw like the PKL rows, `feature_matrix` L2-normalized) and publishes it
+    under the next free sequence number with a single rename. Returns the segment directory.
+    """
+    os.makedirs(delta_dir, exist_ok=True)
+    incoming = os.path.join(delta_dir, f'.incoming-{os.getpid()}')
+    catalog_store.write_catalog(incoming, df, embeddings=embeddings, feature_matrix=feature_matrix)
+
+    existing = segment_dirs(delta_dir)
+    seq = int(os.path.basename(existing[-1])[len(SEGMENT_PREFIX):]) + 1 if existing else 1
+    while True:
+        target = os.path.join(delta_dir, f'{SEGMENT_PREFIX}{seq:06d}')
+        try:
+            # Fails when a concurrent writer took this number; try the next one
+            os.rename(incoming, target)
+            return target
+        except OSError:
+            if not os.path.exists(target):
+                raise
+            seq += 1
+
+
+def read_segments(delta_dir, known_ids):
+    """
+    Yields (segment dir, df, arrays) for every segment, in order, keeping only rows whose id is
+    not in `known_ids` (updated in place as rows are taken). `arrays` are sliced to match `df`.
+    """
+    for seg_dir in segment_dirs(delta_dir):
+        df, arrays = catalog_store.read_catalog(seg_dir)
+        ids = df['id'].astype(str)
+        keep = (~ids.isin(known_ids) & ~ids.duplicated()).to_numpy()
+        if not keep.all():
+            df = df[keep].reset_index(drop=True)
+            arrays = {name: np.asarray(arrays[name])[keep] for name in ('embeddings', 'feature_matrix')
+                      if name in arrays}
+        known_ids.update(ids[keep])
+        yield seg_dir, df, arrays
+
+
+def remove_segments(seg_dirs):
+    for seg_dir in seg_dirs:
+        shutil.rmtree(seg_dir, ignore_errors=True)
+
+
+def commit_compaction(delta_dir, replacements, seg_dirs):
+    """
+    Publishes a compaction: `replacements` are (fully written temporary file, base file) pairs that
+    supersede `seg_dirs`. They are recorded in the marker first, so a crash part-way is rolled forward
+    by the next finish_compaction call instead of leaving base files and segments out of step.
+    """
+    marker = os.path.join(delta_dir, COMPACTION_MARKER)
+    tmp_marker = f"{marker}.tmp-{os.getpid()}"
+    with open(tmp_marker, 'w') as f:
+        json.dump({"replace": [list(pair) for pair in replacements], "segments": list(seg_dirs)}, f, indent=1)
+    os.replace(tmp_marker, marker)
+    finish_compaction(delta_dir)
+
+
+def finish_compaction(delta_dir):
+    """
+    Completes a compaction recorded in `delta_dir` (moves its remaining files into place, removes its
+    segments, then the marker). Safe to repeat or to run concurrently; returns False when none is pending.
+    """
+    marker = os.path.join(delta_dir, COMPACTION_MARKER)
+    try:
+        with open(marker) as f:
+            pending = json.load(f)
+    except FileNotFoundError:
+        return False
+    for tmp_path, path in pending["replace"]:
+        try:
+            os.replace(tmp_path, path)
+        except FileNotFoundError:
+            # Already moved (by an earlier or concurrent run)
+            pass
+    remove_segments(pending["segments"])
+    try:
+        os.remove(marker)
+    except FileNotFoundError:
+        pass
+    return True
+
+
+def main():
+    import argparse
+    import pickle
+    from model_utils import MusicEngine
+
+    parser = argparse.ArgumentParser(description="Append new tracks to the catalog as a delta segment, or compact.")
+    parser.add_argument('command', choices=('append', 'compact'))
+    parser.add_argument('tracks', nargs='?', help="CSV of new tracks (same columns as spotify_tracks.csv)")
+    parser.add_argument('embeddings', nargs='?', help="PKL of their embeddings, one row per CSV row")
+    parser.add_argument('--data-dir', default=None, help="Directory holding spotify_tracks.csv (default: $MUSIC_DATA_DIR, else the app directory)")
+    args = parser.parse_args()
+
+    if args.command == 'compact':
+        rows = MusicEngine.compact_catalog(args.data_dir)
+        print(f"✅ Compacted {rows} delta rows into the base catalog" if rows else "Nothing to compact.")
+        return
+
+    if not args.tracks:
+        parser.error("append needs a tracks CSV")
+    tracks = MusicEngine._read_tracks_csv(args.tracks)
+    embeddings = None
+    if args.embeddings:
+        with open(args.embeddings, 'rb') as f:
+            embeddings = pickle.load(f)
+    engine = MusicEngine(data_dir=args.data_dir)
+    seg_dir = engine.append_tracks(tracks, embeddings)
+    print(f"✅ {len(tracks)} tracks appended as: {seg_dir}")
+
+
+if __name__ == '__main__':
+    main()
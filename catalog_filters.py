@@ -0,0 +1,100 @@
+"""
+catalog_filters.py — Structured metadata filters (year range, tempo band, duration)
+Each filterable column is argsorted once when the catalog loads. A range is then two
+binary searches into that order, and the matching rows come out as a RowSubset, so the
+similarity search scores only those rows: the narrower the filter, the less work.
+
+Filter spec (JSON-friendly), every bound optional and inclusive:
+    {"year": [1990, 1999], "tempo": {"min": 120, "max": 130}, "duration_ms": [null, 240000]}
+"""
+import numpy as np
+
+from ann_index import RowSubset
+
+FILTER_COLUMNS = ('year', 'tempo', 'duration_ms')
+
+
+def normalize_filters(spec):
+    """
+    Validates a filter spec and returns it as a sorted tuple of (column, low, high), with
+    None for an open bound; hashable, so it can be part of a cache key. Empty spec -> ().
+    Raises ValueError for unknown columns or malformed bounds.
+    """
+    if not spec:
+        return ()
+    if isinstance(spec, tuple):
+        # Already normalized (the app normalizes request bodies before calling the engine)
+        try:
+            spec = {column: (low, high) for column, low, high in spec}
+        except (TypeError, ValueError):
+            raise ValueError("filters must be an object keyed by column")
+    if not isinstance(spec, dict):
+        raise ValueError("filters must be an object keyed by column")
+
+    ranges = []
+    for column, bounds in spec.items():
+        if column not in FILTER_COLUMNS:
+            raise ValueError(f"unknown filter '{column}' (expected one of: {', '.join(FILTER_COLUMNS)})")
+        if isinstance(bounds, dict):
+            low, high = bounds.get('min'), bounds.get('max')
+        elif isinstance(bounds, (list, tuple)) and len(bounds) == 2:
+            low, high = bounds
+        else:
+            raise ValueError(f"filter '{column}' must be [min, max] or {{\"min\": .., \"max\": ..}}")
+        try:
+            low = None if low is None else float(low)
+            high = None if high is None else float(high)
+        except (TypeError, ValueError):
+            raise ValueError(f"filter '{column}' bounds must be numbers or null")
+        if low is None and high is None:
+            continue
+        ranges.append((column, low, high))
+    return tuple(sorted(ranges))
+
+
+class FilterIndex:
+    def __init__(self, columns):
+        """`columns` maps each name in FILTER_COLUMNS to its per-row values (NaN-free)."""
+        self.n = len(next(iter(columns.values())))
+        self.values = {}
+        self.order = {}
+        self.sorted_values = {}
+        for name, values in columns.items():
+            values = np.asarray(values, dtype=np.float64)
+            order = np.argsort(values, kind='stable').astype(np.int32)
+            self.values[name] = values
+            self.order[name] = order
+            self.sorted_values[name] = values[order]
+
+    def _range(self, column, low, high):
+        """Slice bounds into the column's sorted order for low <= value <= high."""
+        ordered = self.sorted_values[column]
+        start = 0 if low is None else np.searchsorted(ordered, low, side='left')
+        stop = ordered.shape[0] if high is None else np.searchsorted(ordered, high, side='right')
+        return start, max(start, stop)
+
+    def subset(self, ranges, exclude=None):
+        """
+        RowSubset of rows inside every range of a normalized spec, minus rows flagged in the
+        boolean `exclude` mask (e.g. explicit tracks). The most selective range is read from
+        its sorted index; the others are checked only on those surviving rows.
+        """
+        spans = sorted(((self._range(c, lo, hi), c, lo, hi) for c, lo, hi in ranges),
+                       key=lambda s: s[0][1] - s[0][0])
+        (start, stop), column, _, _ = spans[0]
+        rows = np.sort(self.order[column][start:stop])
+
+        for _, column, low, high in spans[1:]:
+            values = self.values[column][rows]
+            keep = np.ones(rows.shape[0], dtype=bool)
+            if low is not None:
+                keep &= values >= low
+            if high is not None:
+                keep &= values <= high
+            rows = rows[keep]
+        if exclude is not None:
+            rows = rows[~exclude[rows]]
+
+        mask = np.zeros(self.n, dtype=bool)
+        mask[rows] = True
+        return RowSubset(mask, rows)
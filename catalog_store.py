@@ -0,0 +1,204 @@
+"""
+catalog_store.py — Binary columnar cache of the track catalog
+One-time conversion of spotify_tracks.csv + song_embeddings.pkl into a directory of
+NumPy arrays, so workers start without parsing CSV or unpickling.
+
+Layout of the cache directory:
+    manifest.json              sources (size/mtime/sha256), row count, column kinds
+    <col>.npy                  numeric / boolean columns
+    <col>.utf8.npy             string columns: all values concatenated as UTF-8 bytes (uint8)
+    <col>.offsets.npy          ... plus int64 code-point offsets, value i = text[off[i]:off[i+1]]
+    <col>.null.npy             ... plus a null mask, only when the column has missing values
+    embeddings.npy             L2-normalized float32 embedding table (when a PKL was present)
+    feature_matrix.npy         L2-normalized float32 chart-feature matrix
+    search_*.npy               persisted trigram search index (see search_index.py)
+
+The two matrices and the search postings are opened with np.load(mmap_mode='r'): every
+gunicorn worker maps the same page-cache pages, so N workers share one physical copy
+instead of holding N.
+
+Usage:
+    python catalog_store.py [--data-dir DIR]
+"""
+import hashlib
+import json
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+
+CACHE_DIR_NAME = 'catalog_cache'
+FORMAT_VERSION = 2
+
+
+def _file_hash(path, chunk=1 << 20):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(chunk), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _describe_source(path):
+    stat = os.stat(path)
+    return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "sha256": _file_hash(path)}
+
+
+def source_stamp(sources):
+    """
+    Short version id of a set of source files from their names, sizes and mtimes (no hashing,
+    so it is cheap enough to poll). None when none of them exists.
+    """
+    described = sorted((os.path.basename(p), os.stat(p).st_size, os.stat(p).st_mtime_ns)
+                       for p in sources if p and os.path.exists(p))
+    if not described:
+        return None
+    return hashlib.sha256(json.dumps(described).encode()).hexdigest()[:12]
+
+
+def is_fresh(cache_dir, sources):
+    """
+    True when `cache_dir` holds a catalog built from exactly these source files, unchanged.
+    Size + mtime decide quickly; a source whose mtime moved but size did not is re-hashed
+    (redeploys often touch files without changing them).
+    """
+    manifest_path = os.path.join(cache_dir, 'manifest.json')
+    if not os.path.exists(manifest_path):
+        return False
+    try:
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return False
+    if manifest.get('version') != FORMAT_VERSION:
+        return False
+
+    recorded = manifest.get('sources', {})
+    sources = [p for p in sources if p and os.path.exists(p)]
+    if sorted(recorded) != sorted(os.path.basename(p) for p in sources):
+        return False
+
+    for path in sources:
+        entry = recorded[os.path.basename(path)]
+        stat = os.stat(path)
+        if stat.st_size != entry['size']:
+            return False
+        if stat.st_mtime_ns != entry['mtime_ns'] and _file_hash(path) != entry['sha256']:
+            return False
+    return True
+
+
+def _write_strings(out_dir, name, values):
+    nulls = pd.isna(values)
+    texts = ['' if null else str(v) for v, null in zip(values, nulls)]
+    offsets = np.zeros(len(texts) + 1, dtype=np.int64)
+    np.cumsum(np.fromiter(map(len, texts), dtype=np.int64, count=len(texts)), out=offsets[1:])
+    np.save(os.path.join(out_dir, f'{name}.utf8.npy'), np.frombuffer(''.join(texts).encode('utf-8'), dtype=np.uint8))
+    np.save(os.path.join(out_dir, f'{name}.offsets.npy'), offsets)
+    if nulls.any():
+        np.save(os.path.join(out_dir, f'{name}.null.npy'), nulls)
+
+
+def _read_strings(cache_dir, name):
+    text = np.load(os.path.join(cache_dir, f'{name}.utf8.npy')).tobytes().decode('utf-8')
+    offsets = np.load(os.path.join(cache_dir, f'{name}.offsets.npy')).tolist()
+    values = [text[a:b] for a, b in zip(offsets[:-1], offsets[1:])]
+    null_path = os.path.join(cache_dir, f'{name}.null.npy')
+    if os.path.exists(null_path):
+        for i in np.flatnonzero(np.load(null_path)).tolist():
+            values[i] = np.nan
+    return values
+
+
+def write_catalog(cache_dir, df, embeddings=None, sources=(), search_index=None, feature_matrix=None):
+    """
+    Writes `df` (+ normalized embeddings / feature matrix, + search index) to `cache_dir`,
+    replacing any previous cache atomically.
+    """
+    tmp_dir = f"{cache_dir}.tmp-{os.getpid()}"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+
+    columns = {}
+    for name in df.columns:
+        series = df[name]
+        if pd.api.types.is_numeric_dtype(series) or pd.api.types.is_bool_dtype(series):
+            np.save(os.path.join(tmp_dir, f'{name}.npy'), series.to_numpy())
+            columns[name] = 'numeric'
+        else:
+            _write_strings(tmp_dir, name, series.to_numpy())
+            columns[name] = 'string'
+
+    if embeddings is not None:
+        np.save(os.path.join(tmp_dir, 'embeddings.npy'), np.ascontiguousarray(embeddings, dtype=np.float32))
+    if feature_matrix is not None:
+        np.save(os.path.join(tmp_dir, 'feature_matrix.npy'), np.ascontiguousarray(feature_matrix, dtype=np.float32))
+
+    if search_index is not None:
+        arrays = search_index.to_arrays()
+        _write_strings(tmp_dir, 'search_grams', np.array(arrays['grams'], dtype=object))
+        np.save(os.path.join(tmp_dir, 'search_postings.npy'), arrays['postings'])
+        np.save(os.path.join(tmp_dir, 'search_offsets.npy'), arrays['offsets'])
+
+    manifest = {
+        "version": FORMAT_VERSION,
+        "rows": len(df),
+        "columns": columns,
+        "embeddings": embeddings is not None,
+        "feature_matrix": feature_matrix is not None,
+        "search_index": search_index is not None,
+        "sources": {os.path.basename(p): _describe_source(p) for p in sources if p and os.path.exists(p)},
+    }
+    with open(os.path.join(tmp_dir, 'manifest.json'), 'w') as f:
+        json.dump(manifest, f, indent=1)
+
+    shutil.rmtree(cache_dir, ignore_errors=True)
+    os.replace(tmp_dir, cache_dir)
+
+
+def read_catalog(cache_dir):
+    """
+    Returns (df, arrays) from a cache written by write_catalog. `arrays` holds whichever of
+    'embeddings', 'feature_matrix' and 'search' were stored (large arrays as read-only memory maps).
+    """
+    with open(os.path.join(cache_dir, 'manifest.json')) as f:
+        manifest = json.load(f)
+
+    data = {}
+    for name, kind in manifest['columns'].items():
+        if kind == 'numeric':
+            data[name] = np.load(os.path.join(cache_dir, f'{name}.npy'))
+        else:
+            data[name] = pd.Series(_read_strings(cache_dir, name), dtype=object)
+    df = pd.DataFrame(data)
+
+    arrays = {}
+    for name in ('embeddings', 'feature_matrix'):
+        if manifest.get(name):
+            arrays[name] = np.load(os.path.join(cache_dir, f'{name}.npy'), mmap_mode='r')
+
+    if manifest.get('search_index'):
+        arrays['search'] = {
+            "grams": _read_strings(cache_dir, 'search_grams'),
+            "postings": np.load(os.path.join(cache_dir, 'search_postings.npy'), mmap_mode='r'),
+            "offsets": np.load(os.path.join(cache_dir, 'search_offsets.npy')),
+        }
+    return df, arrays
+
+
+def main():
+    import argparse
+    from model_utils import MusicEngine
+
+    parser = argparse.ArgumentParser(description="Convert the CSV/PKL catalog into the binary columnar cache.")
+    parser.add_argument('--data-dir', default=None, help="Directory holding spotify_tracks.csv (default: $MUSIC_DATA_DIR, else the app directory)")
+    args = parser.parse_args()
+
+    cache_dir = MusicEngine.build_catalog_cache(args.data_dir)
+    if cache_dir:
+        print(f"✅ Catalog cache written to: {cache_dir}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,195 @@
+"""
+knn_graph.py — Precomputed k-nearest-neighbour graph over the embedding table
+Seed recommendations depend only on the static embedding table, so the top-K neighbours
+(and their cosine scores) of every track are computed once, offline, and stored as
+compact int32 / float16 arrays. At serve time a seed's candidates are one row lookup.
+
+Layout of the graph directory (next to song_embeddings.pkl, as song_embeddings.knn/):
+    manifest.json      rows, k, fingerprint of the embedding rows it was built from
+    neighbors.npy      int32 (rows, k): neighbour row ids, best first, the track itself excluded
+    scores.npy         float16 (rows, k): matching cosine similarities
+
+Both arrays are opened with mmap_mode='r', so gunicorn workers share one copy. Rows
+appended to the catalog after the build are not covered: they are scored live against
+each seed until compaction (catalog_delta.py compact) extends the graph to them.
+
+Usage:
+    python knn_graph.py [--data-dir DIR] [--k 200] [--workers N]
+"""
+import json
+import os
+import shutil
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from ann_index import fingerprint, top_k_rows
+
+DEFAULT_K = 200
+FORMAT_VERSION = 1
+# Score cells per worker block: bounds each block's temporary (rows x catalog) matrix to ~64 MB
+BLOCK_CELLS = 1 << 24
+
+
+def build_graph(vectors, k=DEFAULT_K, workers=None, progress=True):
+    """
+    Top-k neighbours of every row of the unit-length `vectors`, excluding the row itself.
+    Rows are scored in blocks of one matrix product each, spread over `workers` threads
+    (BLAS and partitioning release the GIL). Returns (neighbors int32, scores float16).
+    """
+    n = vectors.shape[0]
+    k = max(0, min(k, n - 1))
+    neighbors = np.empty((n, k), dtype=np.int32)
+    scores = np.empty((n, k), dtype=np.float16)
+    _score_rows(vectors, neighbors, scores, 0, workers, progress)
+    return neighbors, scores
+
+
+def extend_graph(vectors, neighbors, scores, workers=None, progress=True):
+    """
+    Extends a graph built over the first rows of `vectors` (tracks appended since) to all of them:
+    appended rows get their own neighbour lists, and every covered row merges in the appended rows
+    that beat its current neighbours. Costs (catalog x appended) dot products instead of a rebuild.
+    """
+    n, (covered, k) = vectors.shape[0], neighbors.shape
+    appended = np.ascontiguousarray(vectors[covered:])
+    appended_rows = np.arange(covered, n, dtype=np.int32)
+    out_neighbors = np.empty((n, k), dtype=np.int32)
+    out_scores = np.empty((n, k), dtype=np.float16)
+    block = max(1, BLOCK_CELLS // max(n - covered, 1))
+
+    def merge(start):
+        stop = min(start + block, covered)
+        sims = vectors[start:stop] @ appended.T
+        candidates = np.concatenate([neighbors[start:stop], np.broadcast_to(appended_rows, sims.shape)], axis=1)
+        candidate_scores = np.concatenate([scores[start:stop].astype(np.float32), sims], axis=1)
+        best = top_k_rows(candidate_scores, k)
+        out_neighbors[start:stop] = np.take_along_axis(candidates, best, axis=1)
+        out_scores[start:stop] = np.take_along_axis(candidate_scores, best, axis=1)
+
+    with ThreadPoolExecutor(max_workers=workers or os.cpu_count()) as pool:
+        list(pool.map(merge, range(0, covered, block)))
+    _score_rows(vectors, out_neighbors, out_scores, covered, workers, progress)
+    return out_neighbors, out_scores
+
+
+def _score_rows(vectors, neighbors, scores, first, workers, progress):
+    """Fills rows `first`.. of `neighbors` / `scores` with each row's top-k over all of `vectors`."""
+    n, k = neighbors.shape
+    block = max(1, BLOCK_CELLS // max(vectors.shape[0], 1))
+
+    def run(start):
+        stop = min(start + block, n)
+        sims = vectors[start:stop] @ vectors.T
+        sims[np.arange(stop - start), np.arange(start, stop)] = -np.inf
+        best = top_k_rows(sims, k)
+        neighbors[start:stop] = best
+        scores[start:stop] = np.take_along_axis(sims, best, axis=1)
+        return stop - start
+
+    started = time.perf_counter()
+    total, done, reported = n - first, 0, 0
+    with ThreadPoolExecutor(max_workers=workers or os.cpu_count()) as pool:
+        for rows in pool.map(run, range(first, n, block)):
+            done += rows
+            if progress and (done * 10 // total > reported or done == total):
+                reported = done * 10 // total
+                elapsed = time.perf_counter() - started
+                print(f"   {done}/{total} tracks ({done / elapsed:,.0f} tracks/s)")
+
+
+def write_graph(graph_dir, vectors, neighbors, scores):
+    """Writes a graph built from `vectors`, replacing any previous one atomically."""
+    tmp_dir = f"{graph_dir}.tmp-{os.getpid()}"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+    np.save(os.path.join(tmp_dir, 'neighbors.npy'), neighbors)
+    np.save(os.path.join(tmp_dir, 'scores.npy'), scores)
+    manifest = {
+        "version": FORMAT_VERSION,
+        "rows": int(neighbors.shape[0]),
+        "k": int(neighbors.shape[1]),
+        "fingerprint": fingerprint(vectors[:neighbors.shape[0]]),
+    }
+    with open(os.path.join(tmp_dir, 'manifest.json'), 'w') as f:
+        json.dump(manifest, f, indent=1)
+    shutil.rmtree(graph_dir, ignore_errors=True)
+    os.replace(tmp_dir, graph_dir)
+
+
+class KNNGraph:
+    def __init__(self, neighbors, scores):
+        self.neighbors = neighbors
+        self.scores = scores
+
+    def __len__(self):
+        return self.neighbors.shape[0]
+
+    @property
+    def k(self):
+        return self.neighbors.shape[1]
+
+    @classmethod
+    def load(cls, graph_dir, vectors):
+        """
+        Memory-maps a graph, or returns None when it is missing or was built from other
+        vectors. A graph over a prefix of `vectors` (tracks appended since) still loads.
+        """
+        manifest_path = os.path.join(graph_dir, 'manifest.json')
+        if not os.path.exists(manifest_path):
+            return None
+        try:
+            with open(manifest_path) as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if manifest.get('version') != FORMAT_VERSION or manifest['rows'] > vectors.shape[0]:
+            return None
+        if manifest['fingerprint'] != fingerprint(vectors[:manifest['rows']]):
+            return None
+        return cls(np.load(os.path.join(graph_dir, 'neighbors.npy'), mmap_mode='r'),
+                   np.load(os.path.join(graph_dir, 'scores.npy'), mmap_mode='r'))
+
+    def lookup(self, row, subset=None, min_count=1):
+        """
+        (neighbour rows, float32 scores) of `row`, best first, restricted to `subset` (a RowSubset)
+        when given; None when the row is not covered or fewer than `min_count` neighbours remain.
+        """
+        if row >= self.neighbors.shape[0]:
+            return None
+        rows = self.neighbors[row].astype(np.intp)
+        scores = self.scores[row].astype(np.float32)
+        if subset is not None:
+            keep = subset.mask[rows]
+            rows, scores = rows[keep], scores[keep]
+        if rows.shape[0] < min_count:
+            return None
+        return rows, scores
+
+
+def main():
+    import argparse
+    from model_utils import MusicEngine
+
+    parser = argparse.ArgumentParser(description="Precompute the k-NN graph used for instant seed recommendations.")
+    parser.add_argument('--data-dir', default=None, help="Directory holding spotify_tracks.csv (default: $MUSIC_DATA_DIR, else the app directory)")
+    parser.add_argument('--k', type=int, default=DEFAULT_K, help=f"Neighbours per track (default {DEFAULT_K})")
+    parser.add_argument('--workers', type=int, default=None, help="Scoring threads (default: CPU count)")
+    args = parser.parse_args()
+
+    engine = MusicEngine(data_dir=args.data_dir)
+    if engine.embeddings is None or not engine._embeddings_path:
+        print("❌ No embeddings loaded; nothing to build.")
+        return
+
+    started = time.perf_counter()
+    neighbors, scores = build_graph(engine.embeddings, k=args.k, workers=args.workers)
+    graph_dir = engine.knn_graph_dir()
+    write_graph(graph_dir, engine.embeddings, neighbors, scores)
+    print(f"✅ k-NN graph ({neighbors.shape[0]} x {neighbors.shape[1]}) written to: {graph_dir} "
+          f"in {time.perf_counter() - started:.1f}s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,155 @@
+"""
+metrics.py — Lightweight per-stage timing histograms, rendered as Prometheus text
+No client library: a stage timer is two perf_counter() calls, a bisect and a locked
+counter update (about a microsecond). With METRICS_ENABLED=0 `stage()` hands back a
+shared no-op context manager and nothing is recorded at all.
+
+    with metrics.stage('similarity'):
+        scores = matrix @ query
+
+    @metrics.timed('heuristics')
+    def _apply_heuristics(...): ...
+
+Stages timed across the engine and app: search, seed_lookup, similarity, heuristics,
+serialization, nlp_parse, diversity. Timings of the current request are also collected (per thread
+/ task, via a ContextVar) so the app can send them back in a Server-Timing header.
+"""
+import contextvars
+import os
+import threading
+import time
+from bisect import bisect_left
+from functools import wraps
+
+ENABLED = os.environ.get('METRICS_ENABLED', '1').lower() not in ('0', 'false', 'no', 'off')
+
+# Seconds; fine-grained at the low end, where most engine stages live
+DEFAULT_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+_request_timings = contextvars.ContextVar('request_timings', default=None)
+
+
+class Histogram:
+    def __init__(self, name, help_text, label, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.label = label
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, label_value, seconds):
+        with self._lock:
+            series = self._series.get(label_value)
+            if series is None:
+                # Per-bucket (non-cumulative) counts, +Inf last, then the running sum
+                series = self._series[label_value] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[bisect_left(self.buckets, seconds)] += 1
+            series[-1] += seconds
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            snapshot = {k: list(v) for k, v in self._series.items()}
+        for value, series in sorted(snapshot.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + ('+Inf',), series[:-1]):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{{{self.label}="{value}",le="{bound}"}} {cumulative}')
+            lines.append(f'{self.name}_sum{{{self.label}="{value}"}} {series[-1]:.6f}')
+            lines.append(f'{self.name}_count{{{self.label}="{value}"}} {cumulative}')
+        return lines
+
+
+STAGE_SECONDS = Histogram('music_stage_duration_seconds', 'Time spent per engine stage.', 'stage')
+REQUEST_SECONDS = Histogram('music_request_duration_seconds', 'HTTP request latency per endpoint.', 'endpoint')
+
+
+class _StageTimer:
+    __slots__ = ('name', 'started')
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        elapsed = time.perf_counter() - self.started
+        STAGE_SECONDS.observe(self.name, elapsed)
+        timings = _request_timings.get()
+        if timings is not None:
+            timings[self.name] = timings.get(self.name, 0.0) + elapsed
+        return False
+
+
+class _NoopTimer:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NOOP = _NoopTimer()
+
+
+def stage(name):
+    """Context manager timing one engine stage (a no-op when metrics are disabled)."""
+    return _StageTimer(name) if ENABLED else _NOOP
+
+
+def timed(name):
+    """Decorator form of stage() for functions that are a stage as a whole."""
+    def decorate(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not ENABLED:
+                return fn(*args, **kwargs)
+            with _StageTimer(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def begin_request():
+    """Starts collecting stage timings for the current request."""
+    if ENABLED:
+        _request_timings.set({})
+
+
+def end_request():
+    """Stops collecting; returns {stage: seconds} accumulated during the request (None when not collecting)."""
+    timings = _request_timings.get()
+    _request_timings.set(None)
+    return timings
+
+
+def server_timing_header(timings, total=None):
+    """Server-Timing header value, e.g. 'search;dur=1.84, similarity;dur=0.52, total;dur=3.10' (ms)."""
+    parts = [f"{name};dur={seconds * 1000:.2f}" for name, seconds in timings.items()]
+    if total is not None:
+        parts.append(f"total;dur={total * 1000:.2f}")
+    return ", ".join(parts)
+
+
+def render_gauges(gauges):
+    """Prometheus text for [(name, help, value or {label string: value})] gauges."""
+    lines = []
+    for name, help_text, value in gauges:
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} gauge")
+        if isinstance(value, dict):
+            lines.extend(f"{name}{{{labels}}} {v}" for labels, v in value.items())
+        else:
+            lines.append(f"{name} {value}")
+    return lines
+
+
+def render(gauges=()):
+    """Full /metrics payload: the histograms plus caller-supplied gauges."""
+    lines = STAGE_SECONDS.render() + REQUEST_SECONDS.render() + render_gauges(gauges)
+    return "\n".join(lines) + "\n"
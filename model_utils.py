@@ -1,9 +1,20 @@
 import pandas as pd
 import numpy as np
-from sklearn.metrics.pairwise import cosine_similarity
-from rapidfuzz import process, fuzz
 import pickle
 import os
+import shutil
+import ast
+import re
+import sys
+from itertools import chain, zip_longest
+from ann_index import build_index, top_k, ExactIndex, RowBlocks, RowSubset
+from search_index import SearchIndex
+from cache import LRUCache
+import catalog_store
+import catalog_delta
+import metrics
+from catalog_filters import FilterIndex, normalize_filters
+from knn_graph import extend_graph, write_graph, KNNGraph
 try:
     from nlp_engine import parse_vibe as _nlp_parse_vibe
     _NLP_AVAILABLE = True
@@ -11,20 +22,111 @@ except ImportError:
     _NLP_AVAILABLE = False
 
 
+# Unified audio DNA feature set used for vibe, mix and bridge matching
+CHART_FEATURES = ['danceability', 'energy', 'speechiness', 'acousticness', 'valence', 'instrumentalness']
+
+# Number of top-scoring candidates handed to the relevance heuristics
+HEURISTIC_POOL = 300
+
+# Diversity re-ranking: MMR weight of redundancy when only an artist cap is asked for (0 = relevance order)
+DEFAULT_DIVERSITY = 0.0
+# Version / edit suffixes ignored when deciding that two titles are the same song
+TITLE_NOISE = re.compile(r"\s*[(\[].*?[)\]]|\s+-\s+.*$|\s+(?:feat|ft)\.?\s.*$", re.IGNORECASE)
+
+# Upper bound on the (seeds x catalog) score block materialized by batch scoring (~64MB of float32)
+BATCH_SCORE_CELLS = 1 << 24
+
+# Columns read from the catalog CSV (and required of appended tracks), with their compact dtypes
+CATALOG_COLUMNS = [
+    'id', 'track_name', 'artists', 'explicit',
+    'danceability', 'energy', 'speechiness', 'acousticness',
+    'instrumentalness', 'valence', 'tempo', 'duration_ms', 'year'
+]
+CATALOG_DTYPES = {
+    'explicit': 'bool',
+    'year': 'int16',
+    'danceability': 'float32',
+    'energy': 'float32',
+    'speechiness': 'float32',
+    'acousticness': 'float32',
+    'instrumentalness': 'float32',
+    'valence': 'float32',
+    'tempo': 'float32',
+    'duration_ms': 'int32'
+}
+
+# Audio features reported on every song object, in output order
+SONG_FEATURES = ['danceability', 'energy', 'valence', 'acousticness', 'speechiness', 'instrumentalness', 'tempo']
+
+# Genre labels in rule priority order; the last one is the fallback
+GENRE_LABELS = ["Hip-Hop", "Rock/Metal", "Pop/Dance", "Acoustic", "Instrumental", "Ambient/Chill", "Alternative"]
+
+# Cache bounds: (max entries, TTL seconds)
+VIBE_CACHE_LIMITS = (2048, 3600)
+RESULTS_CACHE_LIMITS = (1024, 600)
+
+# Decimal places kept from feature-query targets; near-identical vectors share one cached answer
+FEATURE_QUANTUM = 3
+
+# Mix aggregation strategies (see get_mix_recommendations)
+MIX_STRATEGIES = ('centroid', 'max_sim', 'kmeans')
+MIX_MAX_CLUSTERS = 8
+# max_sim scores against at most this many members; larger playlists are summarized by k-means first
+MIX_MAX_REPRESENTATIVES = 64
+
+
+def _l2_normalize(matrix):
+    """Returns a contiguous float32 copy of `matrix` with unit-length rows (zero rows stay zero)."""
+    matrix = np.ascontiguousarray(matrix, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
 class MusicEngine:
-    def __init__(self):
+    def __init__(self, df=None, embeddings=None, data_dir=None):
+        """
+        Loads the catalog from disk (the app directory, or `data_dir`),
+        or wraps an in-memory `df`/`embeddings` pair when given.
+        """
+        self.data_dir = self._resolve_data_dir(data_dir)
         self.df = None
         self.embeddings = None
-        self._load_data()
+        self.feature_matrix = None
+        self.embedding_index = None
+        self.knn_graph = None
+        self.search_index = None
+        self._name_index = {}
+        self._id_index = {}
+        self._embeddings_path = None
+        self._cached_arrays = {}
+        self._delta_arrays = {}
+        # Rows of the base catalog; delta segment rows follow them (see catalog_delta.py)
+        self._base_rows = 0
+        self._footprint = None
+        # Identifies the source files the catalog was loaded from (see catalog_store.source_stamp)
+        self.catalog_version = None
+        self.vibe_cache = LRUCache(*VIBE_CACHE_LIMITS)
+        self.results_cache = LRUCache(*RESULTS_CACHE_LIMITS)
+        if df is None:
+            self._load_data()
+        else:
+            self.df = df
+            self.embeddings = embeddings
+        self._build_indexes()
 
-    def _load_data(self):
-        """Loads CSV and PKL files with robust path checking (handles zipped CSV for hosting)."""
-        base_dir = os.path.dirname(os.path.abspath(__file__))
+    @staticmethod
+    def _resolve_data_dir(data_dir=None):
+        """Catalog directory: `data_dir`, else $MUSIC_DATA_DIR, else the app directory (same for the app and every CLI)."""
+        return data_dir or os.environ.get('MUSIC_DATA_DIR') or os.path.dirname(os.path.abspath(__file__))
+
+    def _locate_sources(self):
+        """Returns (csv_path, zip_path, pkl_path) with robust path checking; pkl_path is None when absent."""
+        base_dir = self.data_dir
         
         csv_name = 'spotify_tracks.csv'
         zip_name = 'spotify_tracks.zip'
         
-        # Check if CSV exists, if not, try decompressing ZIP
         csv_path = os.path.join(base_dir, csv_name)
         zip_path = os.path.join(base_dir, zip_name)
         
@@ -33,8 +135,125 @@ class MusicEngine:
             csv_path = os.path.join(base_dir, 'models', csv_name)
             zip_path = os.path.join(base_dir, 'models', zip_name)
 
+        possible_pkl_paths = [
+            os.path.join(base_dir, 'models', 'song_embeddings.pkl'),
+            os.path.join(base_dir, 'song_embeddings.pkl')
+        ]
+        pkl_path = next((p for p in possible_pkl_paths if os.path.exists(p)), None)
+        return csv_path, zip_path, pkl_path
+
+    def source_version(self):
+        """
+        Current version stamp of the catalog files on disk (base files + delta segments);
+        differs from catalog_version once they are replaced or appended to.
+        """
+        sources = self._locate_sources()
+        return catalog_store.source_stamp([*sources, *catalog_delta.segment_manifests(self._delta_dir(sources[0]))])
+
+    def ann_index_path(self):
+        """Where the persisted IVF index for the loaded embeddings lives (None without an embeddings file)."""
+        return os.path.splitext(self._embeddings_path)[0] + '.ivf.npz' if self._embeddings_path else None
+
+    def knn_graph_dir(self):
+        """Where the precomputed k-NN graph for the loaded embeddings lives (None without an embeddings file)."""
+        return os.path.splitext(self._embeddings_path)[0] + '.knn' if self._embeddings_path else None
+
+    def _catalog_cache_dir(self, csv_path):
+        return os.path.join(os.path.dirname(csv_path), catalog_store.CACHE_DIR_NAME)
+
+    def _delta_dir(self, csv_path):
+        return os.path.join(os.path.dirname(csv_path), catalog_delta.DELTA_DIR_NAME)
+
+    def _load_data(self):
+        """
+        Loads the catalog, preferring the binary columnar cache when it is fresher than the CSV/PKL,
+        then appends the rows of any delta segments.
+        """
+        # An interrupted compaction is completed before anything is read or stamped
+        if catalog_delta.finish_compaction(self._delta_dir(self._locate_sources()[0])):
+            print("⚠️ Completed an interrupted catalog compaction")
+        # Stamped before reading: files replaced mid-load then differ from it, so the watcher reloads again
+        # (an archive-only catalog gets one extra reload once its CSV is extracted)
+        self.catalog_version = self.source_version()
+        csv_path, zip_path, pkl_path = self._locate_sources()
+        self._embeddings_path = pkl_path
+        self._cached_arrays = {}
+
+        cache_dir = self._catalog_cache_dir(csv_path)
+        loaded = False
+        if catalog_store.is_fresh(cache_dir, [csv_path, zip_path, pkl_path]):
+            try:
+                self.df, self._cached_arrays = catalog_store.read_catalog(cache_dir)
+                self.embeddings = self._cached_arrays.get('embeddings')
+                print(f"✅ Catalog Loaded (binary cache): {cache_dir}")
+                loaded = True
+            except Exception as e:
+                print(f"❌ Error reading catalog cache, falling back to CSV: {e}")
+        if not loaded:
+            self._read_sources(csv_path, zip_path, pkl_path)
+
+        self._check_alignment()
+        self._base_rows = 0 if self.df is None else len(self.df)
+        self._merge_delta_segments(self._delta_dir(csv_path))
+
+    def _check_alignment(self):
+        """
+        Embedding row i must describe DataFrame row i. A PKL longer than the CSV (embeddings exported
+        ahead of their rows) still lines up on its prefix; a shorter one cannot.
+        """
+        if self.embeddings is None or self.df is None or len(self.embeddings) == len(self.df):
+            return
+        if len(self.embeddings) > len(self.df):
+            print(f"⚠️ {len(self.embeddings)} embedding rows for {len(self.df)} tracks; using the first {len(self.df)}")
+            self.embeddings = self.embeddings[:len(self.df)]
+            self._cached_arrays.pop('embeddings', None)
+        else:
+            raise ValueError(f"Only {len(self.embeddings)} embedding rows for {len(self.df)} tracks")
+
+    def _merge_delta_segments(self, delta_dir):
+        """
+        Appends the rows of every delta segment after the base catalog. Their embedding / feature rows are
+        kept aside in `_delta_arrays` and stacked after the base by `_build_indexes` without copying it.
+        """
+        self._delta_arrays = {}
+        if self.df is None or not catalog_delta.segment_dirs(delta_dir):
+            return
+        frames, embeddings, features = [self.df], [], []
+        for seg_dir, df, arrays in catalog_delta.read_segments(delta_dir, set(self.df['id'].astype(str))):
+            if self.embeddings is not None and (
+                    'embeddings' not in arrays or arrays['embeddings'].shape[1:] != self.embeddings.shape[1:]):
+                print(f"❌ Skipping delta segment without matching embeddings: {seg_dir}")
+                continue
+            frames.append(df)
+            if self.embeddings is not None:
+                embeddings.append(arrays['embeddings'])
+            features.append(arrays.get('feature_matrix'))
+        if len(frames) == 1:
+            return
+
+        self.df = pd.concat(frames, ignore_index=True)
+        # Embeddings are stored raw (compaction copies them into the PKL as they are) and normalized here,
+        # so they match bit for bit what a compacted catalog serves and its persisted indexes stay valid
+        if self.embeddings is not None:
+            self._delta_arrays['embeddings'] = _l2_normalize(np.concatenate(embeddings))
+        if all(f is not None for f in features):
+            self._delta_arrays['feature_matrix'] = np.concatenate(features)
+        print(f"✅ {len(self.df) - self._base_rows} tracks merged from {len(frames) - 1} delta segment(s): {delta_dir}")
+
+    @staticmethod
+    def _read_tracks_csv(path):
+        """Reads a tracks CSV (the catalog, or a batch to append) into the engine's column set and dtypes."""
+        # Usecols and Dtypes for memory efficiency (Crucial for 512MB RAM limit)
+        df = pd.read_csv(path, usecols=CATALOG_COLUMNS, dtype=CATALOG_DTYPES)
+        df.columns = df.columns.str.strip().str.lower()
+        df['search_str'] = df['track_name'].astype(str) + " " + df['artists'].astype(str)
+        return df
+
+    def _read_sources(self, csv_path, zip_path, pkl_path):
+        """Loads CSV and PKL files (handles zipped CSV for hosting)."""
+        # Check if CSV exists, if not, try decompressing ZIP
         if not os.path.exists(csv_path) and os.path.exists(zip_path):
-            print(f"📦 Unzipping {zip_name}...")
+            print(f"📦 Unzipping {os.path.basename(zip_path)}...")
             try:
                 import zipfile
                 with zipfile.ZipFile(zip_path, 'r') as zip_ref:
@@ -45,27 +264,7 @@ class MusicEngine:
 
         if os.path.exists(csv_path):
             try:
-                # Usecols and Dtypes for memory efficiency (Crucial for 512MB RAM limit)
-                use_cols = [
-                    'id', 'track_name', 'artists', 'explicit', 
-                    'danceability', 'energy', 'speechiness', 'acousticness', 
-                    'instrumentalness', 'valence', 'tempo', 'duration_ms', 'year'
-                ]
-                dtype_map = {
-                    'explicit': 'bool',
-                    'year': 'int16',
-                    'danceability': 'float32',
-                    'energy': 'float32',
-                    'speechiness': 'float32',
-                    'acousticness': 'float32',
-                    'instrumentalness': 'float32',
-                    'valence': 'float32',
-                    'tempo': 'float32',
-                    'duration_ms': 'int32'
-                }
-                self.df = pd.read_csv(csv_path, usecols=use_cols, dtype=dtype_map)
-                self.df.columns = self.df.columns.str.strip().str.lower()
-                self.df['search_str'] = self.df['track_name'].astype(str) + " " + self.df['artists'].astype(str)
+                self.df = self._read_tracks_csv(csv_path)
                 print(f"✅ Data Loaded (Memory Optimized): {csv_path}")
             except Exception as e:
                 print(f"❌ Error reading CSV: {e}")
@@ -74,240 +273,794 @@ class MusicEngine:
             self.df = pd.DataFrame()
 
         # Load Embeddings (PKL)
-        possible_pkl_paths = [
-            os.path.join(base_dir, 'models', 'song_embeddings.pkl'),
-            os.path.join(base_dir, 'song_embeddings.pkl')
-        ]
-        
-        for path in possible_pkl_paths:
-            if os.path.exists(path):
-                try:
-                    with open(path, 'rb') as f:
-                        self.embeddings = pickle.load(f)
-                    print(f"✅ Embeddings Loaded from: {path}")
-                    break
-                except Exception as e:
-                    print(f"❌ Error reading PKL: {e}")
+        if pkl_path:
+            try:
+                with open(pkl_path, 'rb') as f:
+                    self.embeddings = pickle.load(f)
+                print(f"✅ Embeddings Loaded from: {pkl_path}")
+            except Exception as e:
+                print(f"❌ Error reading PKL: {e}")
 
+    @classmethod
+    def build_catalog_cache(cls, data_dir=None):
+        """One-time conversion of the CSV/PKL catalog into the binary columnar cache. Returns its directory."""
+        engine = cls.__new__(cls)
+        engine.data_dir = cls._resolve_data_dir(data_dir)
+        engine.df, engine.embeddings = None, None
+        csv_path, zip_path, pkl_path = engine._locate_sources()
+        engine._read_sources(csv_path, zip_path, pkl_path)
+        if engine.df is None or engine.df.empty:
+            return None
 
-    def search_song(self, query):
-        """Local fuzzy search on CSV data."""
+        cache_dir = engine._catalog_cache_dir(csv_path)
+        catalog_store.write_catalog(
+            cache_dir, engine.df,
+            embeddings=_l2_normalize(engine.embeddings) if engine.embeddings is not None else None,
+            sources=[csv_path, zip_path, pkl_path],
+            search_index=SearchIndex(engine.df['search_str'].tolist()),
+            feature_matrix=_l2_normalize(engine.df[CHART_FEATURES].values),
+        )
+        return cache_dir
+
+    def append_tracks(self, tracks, embeddings=None):
+        """
+        Writes new tracks (a DataFrame with CATALOG_COLUMNS) and their embeddings (row i for track i)
+        as a delta segment next to this engine's catalog, and returns the segment directory. They are
+        served from the next load / hot reload on; the base files are not touched.
+        Raises ValueError on missing columns, ids already in the catalog or its segments, or misaligned embeddings.
+        """
+        missing = [c for c in CATALOG_COLUMNS if c not in tracks.columns]
+        if missing:
+            raise ValueError(f"tracks are missing columns: {', '.join(missing)}")
+        tracks = tracks[CATALOG_COLUMNS].astype(CATALOG_DTYPES).reset_index(drop=True)
+        ids = tracks['id'].astype(str)
+        delta_dir = self._delta_dir(self._locate_sources()[0])
+        # Segments written since this engine loaded are not in _id_index yet
+        clashes = ids[ids.duplicated() | ids.isin(self._id_index) | ids.isin(catalog_delta.segment_ids(delta_dir))]
+        if len(clashes):
+            raise ValueError(f"track ids already in the catalog (or repeated): {', '.join(clashes[:5])}")
+
+        if self.embeddings is not None:
+            if embeddings is None:
+                raise ValueError("this catalog has embeddings; pass one embedding row per track")
+            embeddings = np.asarray(embeddings, dtype=np.float32)
+            if embeddings.shape != (len(tracks),) + self.embeddings.shape[1:]:
+                raise ValueError(f"embeddings shape {embeddings.shape} does not match "
+                                 f"{(len(tracks),) + self.embeddings.shape[1:]}")
+        else:
+            embeddings = None
+
+        tracks['search_str'] = tracks['track_name'].astype(str) + " " + tracks['artists'].astype(str)
+        return catalog_delta.write_segment(delta_dir, tracks, embeddings=embeddings,
+                                           feature_matrix=_l2_normalize(tracks[CHART_FEATURES].values))
+
+    @classmethod
+    def compact_catalog(cls, data_dir=None):
+        """
+        Folds every delta segment into spotify_tracks.csv / song_embeddings.pkl, rebuilds the binary
+        cache, removes the segments and extends the IVF index / k-NN graph to the new rows.
+        Returns the number of rows folded in.
+        Crash-safe: both new base files are written under temporary names and recorded with the segments
+        they supersede (catalog_delta.commit_compaction) before any is moved into place, and a load that
+        finds the record finishes the moves and deletions first.
+        """
+        engine = cls.__new__(cls)
+        engine.data_dir = cls._resolve_data_dir(data_dir)
+        engine.df, engine.embeddings = None, None
+        csv_path, zip_path, pkl_path = engine._locate_sources()
+        delta_dir = engine._delta_dir(csv_path)
+        catalog_delta.finish_compaction(delta_dir)
+        seg_dirs = catalog_delta.segment_dirs(delta_dir)
+        if not seg_dirs:
+            return 0
+        engine._read_sources(csv_path, zip_path, pkl_path)
+        if engine.df is None or engine.df.empty:
+            raise ValueError(f"no base catalog at {csv_path} to compact into")
+        engine._cached_arrays = {}
+        engine._check_alignment()
+
+        engine._embeddings_path = pkl_path
+        frames, embeddings = [], []
+        for _, df, arrays in catalog_delta.read_segments(delta_dir, set(engine.df['id'].astype(str))):
+            frames.append(df)
+            embeddings.append(arrays.get('embeddings'))
+        new_rows = pd.concat(frames, ignore_index=True) if frames else None
+
+        replacements = []
+        if new_rows is not None and len(new_rows):
+            if engine.embeddings is not None:
+                if any(e is None for e in embeddings):
+                    raise ValueError("a delta segment has no embeddings; cannot fold it into the PKL")
+                engine.embeddings = np.concatenate([np.asarray(engine.embeddings, dtype=np.float32), *embeddings])
+                tmp_pkl = f"{pkl_path}.tmp-{os.getpid()}"
+                with open(tmp_pkl, 'wb') as f:
+                    pickle.dump(engine.embeddings, f)
+                replacements.append((tmp_pkl, pkl_path))
+
+            # The CSV is copied and appended to rather than re-serialized, keeping the base rows byte-for-byte
+            header = pd.read_csv(csv_path, nrows=0).columns.str.strip().str.lower()
+            with open(csv_path, 'rb') as f:
+                f.seek(-1, os.SEEK_END)
+                needs_newline = f.read(1) != b'\n'
+            tmp_csv = f"{csv_path}.tmp-{os.getpid()}"
+            shutil.copyfile(csv_path, tmp_csv)
+            with open(tmp_csv, 'a', newline='') as f:
+                if needs_newline:
+                    f.write('\n')
+                new_rows.reindex(columns=header).to_csv(f, header=False, index=False)
+            replacements.append((tmp_csv, csv_path))
+
+        catalog_delta.commit_compaction(delta_dir, replacements, seg_dirs)
+        if os.path.isdir(engine._catalog_cache_dir(csv_path)):
+            cls.build_catalog_cache(engine.data_dir)
+        if new_rows is not None and len(new_rows) and engine.embeddings is not None:
+            # Bring the persisted IVF index and k-NN graph up to the compacted rows once, here,
+            # rather than in every worker on every start
+            vectors = _l2_normalize(engine.embeddings)
+            build_index(vectors, engine.ann_index_path())
+            engine._extend_knn_graph(vectors)
+        return 0 if new_rows is None else len(new_rows)
+
+    def _extend_knn_graph(self, vectors):
+        """Extends a k-NN graph built before rows were appended to `vectors` (a no-op without one)."""
+        graph_dir = self.knn_graph_dir()
+        graph = KNNGraph.load(graph_dir, vectors) if graph_dir else None
+        if graph is None or len(graph) >= len(vectors):
+            return
+        neighbors, scores = extend_graph(vectors, graph.neighbors, graph.scores, progress=False)
+        write_graph(graph_dir, vectors, neighbors, scores)
+        print(f"✅ k-NN graph extended to {len(vectors)} tracks: {graph_dir}")
+
+    def reload(self):
+        """
+        Re-reads the catalog from disk, rebuilds every index and drops cached answers, in place.
+        A serving app should build a new engine and swap its reference instead (see app.reload_engine).
+        """
+        self._load_data()
+        self._build_indexes()
+
+    def invalidate_caches(self):
+        self.vibe_cache.clear()
+        self.results_cache.clear()
+
+    def cache_stats(self):
+        """Size and hit/miss counters of each cache layer, for monitoring."""
+        return {"vibe": self.vibe_cache.stats(), "results": self.results_cache.stats()}
+
+    def memory_footprint(self):
+        """
+        Bytes held by the catalog structures, by part (computed once per load: the deep
+        DataFrame measurement walks every string). Memory-mapped arrays count at full size.
+        """
+        if self._footprint is None:
+            parts = {"dataframe": 0 if self.df is None else int(self.df.memory_usage(deep=True).sum())}
+            for name, array in (("embeddings", self.embeddings), ("feature_matrix", self.feature_matrix)):
+                parts[name] = 0 if array is None else int(array.nbytes)
+            if self.knn_graph is not None:
+                parts["knn_graph"] = int(self.knn_graph.neighbors.nbytes + self.knn_graph.scores.nbytes)
+            if self.search_index is not None:
+                parts["search_index"] = int(self.search_index.postings.nbytes + self.search_index.offsets.nbytes)
+            self._footprint = parts
+        return self._footprint
+
+    def _build_indexes(self):
+        """Precomputes static lookup structures derived from the loaded catalog."""
+        self.invalidate_caches()
+        self._footprint = None
         if self.df is None or self.df.empty:
-            print("❌ Error: No local data available.")
-            return []
+            return
 
         if 'search_str' not in self.df.columns:
             self.df['search_str'] = self.df['track_name'].astype(str) + " " + self.df['artists'].astype(str)
-
+        # A search index persisted with the catalog cache skips the trigram build; delta rows are indexed on top
         choices = self.df['search_str'].tolist()
-        matches = process.extract(query, choices, limit=5, scorer=fuzz.partial_ratio)
+        search_arrays = self._cached_arrays.get('search')
+        base_rows = self._base_rows if search_arrays is not None else len(choices)
+        self.search_index = SearchIndex(choices[:base_rows], arrays=search_arrays)
+        if base_rows < len(choices):
+            self.search_index.extend(choices[base_rows:])
 
-        results = []
-        for match_str, score, idx in matches:
-            row = self.df.iloc[idx]
-            results.append(self._format_json_song(row, score))
-            
-        return results
+        # Seed lookup tables; reversed insertion keeps the first row for duplicate titles/ids
+        positions = range(len(self.df) - 1, -1, -1)
+        self._name_index = dict(zip(self.df['track_name'].str.lower().values[::-1], positions))
+        self._id_index = dict(zip(self.df['id'].astype(str).values[::-1], positions))
 
-    @staticmethod
-    def _infer_genre(features):
-        """Infers a genre label based on audio DNA features."""
-        energy = features.get('energy', 0.5)
-        valence = features.get('valence', 0.5)
-        dance = features.get('danceability', 0.5)
-        acoustic = features.get('acousticness', 0.5)
-        speech = features.get('speechiness', 0.5)
-        instr = features.get('instrumentalness', 0.0)
-
-        if speech > 0.6:
-            return "Hip-Hop"
-        elif energy > 0.8 and valence < 0.5:
-            return "Rock/Metal"
-        elif dance > 0.7 and energy > 0.6:
-            return "Pop/Dance"
-        elif acoustic > 0.7:
-            return "Acoustic"
-        elif instr > 0.7:
-            return "Instrumental"
-        elif energy < 0.4 and valence < 0.4:
-            return "Ambient/Chill"
+        # Unit-length rows turn cosine similarity into a single matrix-vector product
+        # (the catalog cache stores both matrices pre-normalized and memory-maps them, shared across workers)
+        # Delta rows are stacked after a memory-mapped base (RowBlocks) instead of copying it
+        self.feature_matrix = self._cached_arrays.get('feature_matrix')
+        if self.feature_matrix is None:
+            self.feature_matrix = _l2_normalize(self.df[CHART_FEATURES].values)
+        elif self._base_rows < len(self.df):
+            delta_features = self._delta_arrays.get('feature_matrix')
+            if delta_features is None:
+                delta_features = _l2_normalize(self.df[CHART_FEATURES].values[self._base_rows:])
+            self.feature_matrix = RowBlocks(self.feature_matrix, delta_features)
+        self.feature_index = ExactIndex(self.feature_matrix)
+
+        self._derive_song_columns()
+
+        if self.embeddings is not None:
+            # Normalized in place of the raw table (cosine is scale-invariant) to avoid holding two copies
+            if 'embeddings' not in self._cached_arrays:
+                self.embeddings = _l2_normalize(self.embeddings)
+            if 'embeddings' in self._delta_arrays:
+                self.embeddings = RowBlocks(self.embeddings, self._delta_arrays['embeddings'])
+            self.embedding_index = build_index(self.embeddings, self.ann_index_path())
+
+            # Offline neighbour lists (python knn_graph.py), when built from these embeddings
+            graph_dir = self.knn_graph_dir()
+            self.knn_graph = KNNGraph.load(graph_dir, self.embeddings) if graph_dir else None
+            if self.knn_graph is not None:
+                print(f"✅ k-NN graph loaded from: {graph_dir} ({len(self.knn_graph)} tracks, k={self.knn_graph.k})")
+
+        # Everything cached has been adopted; drop the loader's references
+        self._cached_arrays = {}
+        self._delta_arrays = {}
+
+    def _derive_song_columns(self):
+        """
+        Computes every per-track value the hot paths need (serialization columns, parsed artists,
+        genre, rarity, static relevance prior) once, as compact typed arrays.
+        """
+        n = len(self.df)
+        optional_defaults = {'instrumentalness': 0, 'tempo': 120}
+        self._song_features = np.column_stack([
+            self.df[f].to_numpy(np.float32) if f in self.df.columns or f not in optional_defaults
+            else np.full(n, optional_defaults[f], np.float32)
+            for f in SONG_FEATURES
+        ])
+        self._ids = self.df['id'].to_numpy()
+        self._track_names = self.df['track_name'].to_numpy()
+        self._song_years = self.df['year'].to_numpy() if 'year' in self.df.columns else np.full(n, 2020)
+        self._albums = self.df['album'].to_numpy() if 'album' in self.df.columns else None
+        if 'explicit' in self.df.columns:
+            self._explicit = self.df['explicit'].astype(str).str.upper().eq('TRUE').to_numpy()
         else:
-            return "Alternative"
+            self._explicit = np.zeros(n, dtype=bool)
+        # Clean-only partition: explicit-free requests rank just these rows, so filtering never thins a result list
+        self._clean_rows = RowSubset(~self._explicit)
+
+        # Artist lists parsed once per distinct string; repeated artists share one tuple of interned names
+        parsed = {}
+        self._artists = np.empty(n, dtype=object)
+        for i, artist_str in enumerate(self.df['artists'].tolist()):
+            names = parsed.get(artist_str)
+            if names is None:
+                names = parsed[artist_str] = tuple(
+                    sys.intern(a) if isinstance(a, str) else a for a in self._parse_artist_names(artist_str)
+                )
+            self._artists[i] = names
+        # Integer keys for the diversity stage: primary artist, and song version = (title stripped of
+        # version suffixes, primary artist), so only remasters / live takes of the same song share one
+        self._artist_keys = pd.factorize(pd.Series([a[0] if a else '' for a in self._artists], dtype=object))[0]
+        title_keys = pd.factorize(self._normalize_titles(self.df['track_name']))[0].astype(np.int64)
+        self._version_keys = pd.factorize(title_keys * (int(self._artist_keys.max()) + 1) + self._artist_keys)[0]
+
+        # float64 so every comparison matches float(row[...]) on the old scalar path
+        features = self._song_features.astype(np.float64)
+
+        # Heuristic rarity: distance from sonic equilibrium (0.5)
+        deviation = np.abs(features[:, :4] - 0.5).mean(axis=1)
+        self._rarity = np.minimum(100, deviation * 220).astype(np.uint8)
+        self._genre_codes = self._infer_genre_codes(features)
+
+        # Static half of the relevance heuristic: recency boost + duration penalty
+        years = pd.to_numeric(self.df['year'], errors='coerce').fillna(2000).values
+        durations = pd.to_numeric(self.df['duration_ms'], errors='coerce').fillna(200000).values
+        # Max +0.03 boost for years 1980-2025
+        year_boost = np.clip((years - 1980) / 45.0, 0, 1) * 0.03
+        # Penalty for intro/outro tracks (<90s) or extremely long tracks (>7m)
+        dur_penalty = np.where((durations < 90000) | (durations > 420000), -0.04, 0)
+        self._static_prior = (year_boost + dur_penalty).astype(np.float32)
+
+        self._tempos = pd.to_numeric(self.df['tempo'], errors='coerce').fillna(120).values.astype(np.float32)
+
+        # Sorted per-column indexes behind the year / tempo / duration filters
+        self.filter_index = FilterIndex({'year': years, 'tempo': self._tempos, 'duration_ms': durations})
+
+    def search_song(self, query):
+        """Local fuzzy search on CSV data (trigram-indexed candidates, rapidfuzz scoring)."""
+        if self.df is None or self.df.empty:
+            print("❌ Error: No local data available.")
+            return []
+
+        with metrics.stage('search'):
+            matches = self.search_index.search(query, limit=5)
+        return self._format_songs([idx for _, _, idx in matches], [score for _, score, _ in matches])
 
     @staticmethod
-    def _parse_artists(artist_str):
+    def _infer_genre_codes(features):
+        """Infers genre codes (indices into GENRE_LABELS) for a block of songs (columns as in SONG_FEATURES)."""
+        dance, energy, valence, acoustic, speech, instr = (features[:, i] for i in range(6))
+        return np.select(
+            [speech > 0.6,
+             (energy > 0.8) & (valence < 0.5),
+             (dance > 0.7) & (energy > 0.6),
+             acoustic > 0.7,
+             instr > 0.7,
+             (energy < 0.4) & (valence < 0.4)],
+            np.arange(len(GENRE_LABELS) - 1),
+            default=len(GENRE_LABELS) - 1
+        ).astype(np.uint8)
+
+    @staticmethod
+    def _normalize_titles(titles):
+        """Dedup keys for titles: 'Song (Remastered 2011)', 'Song - Live' and 'song feat. X' all become 'song'."""
+        stripped = titles.astype(str).str.replace(TITLE_NOISE, '', regex=True)
+        keys = stripped.str.lower().str.replace(r'[\W_]+', '', regex=True)
+        # Titles that are nothing but noise keep their full text
+        return keys.where(keys != '', titles.astype(str).str.lower())
+
+    @staticmethod
+    def _parse_artist_names(artist_str):
         """Robustly parses artist strings from CSV, handling ['Name'] format."""
-        import ast
         try:
             if isinstance(artist_str, str) and artist_str.startswith('['):
-                artists = ast.literal_eval(artist_str)
-                return [{"name": a} for a in artists]
+                return list(ast.literal_eval(artist_str))
             else:
-                return [{"name": str(artist_str)}]
+                return [str(artist_str)]
         except Exception:
             # Fallback for malformed strings
-            return [{"name": str(artist_str).strip("[]'\"")}]
-
-    def _format_json_song(self, row, score=None, rarity=None):
-        """Converts a CSV row into a structured song object with optional score and rarity."""
-        features = {
-            "danceability": float(row['danceability']),
-            "energy": float(row['energy']),
-            "valence": float(row['valence']),
-            "acousticness": float(row['acousticness']),
-            "speechiness": float(row['speechiness']),
-            "instrumentalness": float(row.get('instrumentalness', 0)),
-            "tempo": float(row.get('tempo', 120))
-        }
-        
-        # Heuristic rarity if not provided: distance from sonic equilibrium (0.5)
-        if rarity is None:
-            deviation = np.mean([abs(features[f] - 0.5) for f in ['danceability', 'energy', 'valence', 'acousticness']])
-            rarity = int(min(100, deviation * 220))
+            return [str(artist_str).strip("[]'\"")]
 
-        return {
-            "id": str(row['id']),
-            "name": row['track_name'],
-            "year": int(row['year']) if 'year' in row else 2020,
-            "artists": self._parse_artists(row['artists']),
-            "album": {
-                "name": row['album'] if 'album' in row else "Unknown",
-            },
-            "genre": self._infer_genre(features),
-            "features": features,
-            "match_score": score if score else 100,
-            "rarity_score": rarity
-        }
+    @metrics.timed('serialization')
+    def _format_songs(self, indices, scores=None):
+        """
+        Converts catalog rows into structured song objects with optional match scores.
+        Columns for every selected row, including the precomputed derived fields
+        (artists, genre, rarity), are gathered in one fancy-indexing step.
+        """
+        indices = np.asarray(indices, dtype=np.intp)
+        if scores is None:
+            scores = [None] * len(indices)
+
+        features = self._song_features[indices].astype(np.float64).tolist()
+        rarities = self._rarity[indices].tolist()
+        genres = [GENRE_LABELS[c] for c in self._genre_codes[indices].tolist()]
+
+        ids = self._ids[indices].tolist()
+        names = self._track_names[indices].tolist()
+        years = self._song_years[indices].tolist()
+        artists = self._artists[indices].tolist()
+        albums = self._albums[indices].tolist() if self._albums is not None else ["Unknown"] * len(indices)
+
+        return [
+            {
+                "id": str(ids[i]),
+                "name": names[i],
+                "year": int(years[i]),
+                "artists": [{"name": a} for a in artists[i]],
+                "album": {
+                    "name": albums[i],
+                },
+                "genre": genres[i],
+                "features": dict(zip(SONG_FEATURES, row)),
+                "match_score": scores[i] if scores[i] else 100,
+                "rarity_score": rarities[i]
+            }
+            for i, row in enumerate(features)
+        ]
 
-    def _apply_heuristics(self, related_indices, sim_scores, target_tempo=None):
-        """Applies a relevance heuristic to the top 300 matches.
+    @metrics.timed('heuristics')
+    def _apply_heuristics(self, top_indices, top_scores, target_tempo=None):
+        """Applies a relevance heuristic to the top matches (candidate indices with their similarity scores).
         Boosts newer tracks and penalizes excessively short/long tracks to substitute for lack of popularity data.
+        Works row-wise on 2-D candidate blocks (one row per seed) as well as on a single candidate list.
         """
-        top_indices = related_indices[:300]
-        years = pd.to_numeric(self.df.iloc[top_indices]['year'], errors='coerce').fillna(2000).values
-        durations = pd.to_numeric(self.df.iloc[top_indices]['duration_ms'], errors='coerce').fillna(200000).values
-        
-        # Max +0.03 boost for years 1980-2025
-        year_boost = np.clip((years - 1980) / 45.0, 0, 1) * 0.03
-        # Penalty for intro/outro tracks (<90s) or extremely long tracks (>7m)
-        dur_penalty = np.where((durations < 90000) | (durations > 420000), -0.04, 0)
+        # Year boost and duration penalty are static per track (see _derive_song_columns)
+        static_prior = self._static_prior[top_indices]
         
         # Tempo penalty logic for Vibe-based searches
-        tempo_penalty = np.zeros(len(top_indices))
+        tempo_penalty = np.zeros(top_indices.shape)
         if target_tempo is not None:
-            tempos = pd.to_numeric(self.df.iloc[top_indices]['tempo'], errors='coerce').fillna(120).values
+            tempos = self._tempos[top_indices]
             bpm_diff = np.abs(tempos - target_tempo)
             # -0.01 penalty for every 5 BPM difference, max penalty of -0.20
             tempo_penalty = -np.clip(bpm_diff / 500.0, 0, 0.20)
         
-        adjusted_scores = sim_scores[top_indices] + year_boost + dur_penalty + tempo_penalty
-        resorted_args = adjusted_scores.argsort()[::-1]
+        adjusted_scores = top_scores + static_prior + tempo_penalty
+        resorted_args = adjusted_scores.argsort(axis=-1)[..., ::-1]
         
         # Return sorted top indices and their corresponding original scores
-        return top_indices[resorted_args], sim_scores[top_indices[resorted_args]]
+        return (np.take_along_axis(top_indices, resorted_args, axis=-1),
+                np.take_along_axis(top_scores, resorted_args, axis=-1))
 
-    def get_recommendations(self, seed_song_name, limit=10, allow_explicit=True):
-        """Standard recommendation flow with seed song, using pure embeddings matching."""
-        if self.df is None or self.df.empty:
-            return None
+    def _diversify(self, final_indices, final_scores, limit, diversity=DEFAULT_DIVERSITY, max_per_artist=None,
+                   skip_idx=None):
+        """
+        Maximal-marginal-relevance re-ranking of heuristic-sorted candidates (the first HEURISTIC_POOL).
+        Each pick maximizes (1 - diversity) * relevance - diversity * (max similarity to the tracks already
+        picked), using one pairwise similarity matrix of the candidate embeddings. Other versions of a song
+        already listed (or of the seed; same title and primary artist) are dropped, and at most
+        `max_per_artist` tracks per primary artist are kept. Returns (indices, scores) of up to `limit` picks, in pick order.
+        """
+        indices, scores = final_indices[:HEURISTIC_POOL], final_scores[:HEURISTIC_POOL]
+        # First (best-ranked) version of each song; the seed's own song counts as taken
+        versions = self._version_keys[indices]
+        _, first = np.unique(versions, return_index=True)
+        keep = np.zeros(len(indices), dtype=bool)
+        keep[first] = True
+        if skip_idx is not None:
+            keep &= versions != self._version_keys[skip_idx]
+        indices, scores = indices[keep], scores[keep]
+        if len(indices) == 0:
+            return indices, scores
+
+        # Relevance as ranked by _apply_heuristics (similarity + static prior)
+        relevance = scores + self._static_prior[indices]
+        vectors = self.embeddings[indices]
+        similarity = vectors @ vectors.T
+        artists = self._artist_keys[indices]
+
+        available = np.ones(len(indices), dtype=bool)
+        redundancy = np.zeros(len(indices), dtype=similarity.dtype)
+        artist_counts = {}
+        picks = []
+        while len(picks) < limit and available.any():
+            mmr = (1 - diversity) * relevance - diversity * redundancy
+            pick = int(np.argmax(np.where(available, mmr, -np.inf)))
+            picks.append(pick)
+            available[pick] = False
+            redundancy = np.maximum(redundancy, similarity[pick])
+            if max_per_artist is not None:
+                artist = artists[pick]
+                artist_counts[artist] = artist_counts.get(artist, 0) + 1
+                if artist_counts[artist] >= max_per_artist:
+                    available &= artists != artist
+        return indices[picks], scores[picks]
+
+    def _select_results(self, final_indices, final_scores, limit, allow_explicit=True, skip_idx=None, exclude_set=None,
+                        chunk_size=None):
+        """
+        Takes ranked candidates through the seed/explicit/name filters and formats the first `limit`.
+        With `chunk_size`, returns a generator of formatted chunks (in rank order) instead of one list.
+        """
+        keep = np.ones(len(final_indices), dtype=bool)
+        if skip_idx is not None:
+            keep &= final_indices != skip_idx
+        if not allow_explicit:
+            keep &= ~self._explicit[final_indices]
+        positions = np.flatnonzero(keep)
 
-        idx_list = self.df.index[self.df['track_name'].str.lower() == seed_song_name.lower()].tolist()
-        if not idx_list:
+        if exclude_set:
+            names = self._track_names
+            positions = [p for p in positions if str(names[final_indices[p]]).lower() not in exclude_set]
+        positions = positions[:limit]
+
+        rows = final_indices[positions]
+        scores = [int(final_scores[p] * 100) for p in positions]
+        if chunk_size is None:
+            return self._format_songs(rows, scores)
+        return (self._format_songs(rows[i:i + chunk_size], scores[i:i + chunk_size])
+                for i in range(0, len(scores), chunk_size))
+
+    def _eligible_rows(self, allow_explicit=True, filters=()):
+        """Row subset a request may rank (None = whole catalog). `filters` is a normalized filter spec."""
+        if filters:
+            return self.filter_index.subset(filters, exclude=None if allow_explicit else self._explicit)
+        return None if allow_explicit else self._clean_rows
+
+    @metrics.timed('seed_lookup')
+    def _resolve_seed(self, name=None, track_id=None):
+        """Row position of a seed track: by id when given, else by case-insensitive title (first match)."""
+        if track_id is not None:
+            return self._id_index.get(str(track_id))
+        if name is not None:
+            return self._name_index.get(name.lower())
+        return None
+
+    def get_recommendations(self, seed_song_name=None, limit=10, allow_explicit=True, seed_id=None, filters=None,
+                            diversity=None, max_per_artist=None):
+        """
+        Standard recommendation flow with seed song (by title or track id), using pure embeddings matching.
+        `filters` restricts candidates by year / tempo / duration (see catalog_filters.py).
+        `diversity` (0-1) and / or `max_per_artist` turn on the diversity re-ranking (see _diversify).
+        """
+        events = self.iter_recommendations(seed_song_name, limit, allow_explicit, seed_id, filters, chunk_size=max(limit, 1),
+                                           diversity=diversity, max_per_artist=max_per_artist)
+        selected = next(events, None)
+        if selected is None:
             return None
+        return {
+            "selected": selected[1],
+            "recommendations": [song for _, chunk in events for song in chunk]
+        }
+
+    def iter_recommendations(self, seed_song_name=None, limit=10, allow_explicit=True, seed_id=None, filters=None,
+                             chunk_size=5, diversity=None, max_per_artist=None):
+        """
+        Generator form of get_recommendations: yields ("selected", song) as soon as the seed is
+        resolved, then ("recommendations", [songs]) chunks in rank order. Yields nothing when the
+        seed is unknown.
+        """
+        if self.df is None or self.df.empty:
+            return
+        filters = normalize_filters(filters)
+
+        seed_idx = self._resolve_seed(seed_song_name, seed_id)
+        if seed_idx is None:
+            return
 
-        seed_idx = idx_list[0]
-        seed_row = self.df.iloc[seed_idx]
-        seed_embedding = self.embeddings[seed_idx].copy().reshape(1, -1)
+        yield "selected", self._format_songs([seed_idx], [100])[0]
 
-        sim_scores = cosine_similarity(seed_embedding, self.embeddings).flatten()
-        related_indices = sim_scores.argsort()[::-1]
+        subset = self._eligible_rows(allow_explicit, filters)
+
+        # Precomputed neighbour list when the graph covers this seed and enough of it survives the filters;
+        # otherwise live candidate retrieval through the (approximate) nearest-neighbour index
+        with metrics.stage('similarity'):
+            seed_embedding = self.embeddings[seed_idx]
+            related = self.knn_graph.lookup(seed_idx, subset, min_count=limit) if self.knn_graph is not None else None
+            if related is not None:
+                # Re-scored in float32 (K dot products): float16 graph scores would reorder near-ties
+                related_indices = related[0]
+                related_scores = self.embeddings[related_indices] @ seed_embedding
+                covered = len(self.knn_graph)
+                if covered < len(self.embeddings):
+                    # Tracks appended after the graph was built are scored live and compete with its neighbours
+                    tail_indices = np.arange(covered, len(self.embeddings))
+                    tail_scores = self.embeddings[covered:] @ seed_embedding
+                    if subset is not None:
+                        keep = subset.mask[covered:]
+                        tail_indices, tail_scores = tail_indices[keep], tail_scores[keep]
+                    best = top_k(tail_scores, self.knn_graph.k)
+                    related_indices = np.concatenate([related_indices, tail_indices[best]])
+                    related_scores = np.concatenate([related_scores, tail_scores[best]])
+            else:
+                related_indices, related_scores = self.embedding_index.search(
+                    seed_embedding, max(HEURISTIC_POOL, limit + 1), subset)
         
         # Apply Heuristics
-        final_indices, final_scores = self._apply_heuristics(related_indices, sim_scores)
-
-        recommendations = []
-        for i, r_idx in enumerate(final_indices):
-            if r_idx == seed_idx: continue
-            
-            row = self.df.iloc[r_idx]
-            
-            if not allow_explicit and 'explicit' in row and str(row['explicit']).upper() == 'TRUE':
-                continue
+        final_indices, final_scores = self._apply_heuristics(related_indices, related_scores)
+        if diversity is not None or max_per_artist is not None:
+            with metrics.stage('diversity'):
+                final_indices, final_scores = self._diversify(
+                    final_indices, final_scores, limit, DEFAULT_DIVERSITY if diversity is None else diversity,
+                    max_per_artist, skip_idx=seed_idx)
 
-            score = int(final_scores[i] * 100)
-            recommendations.append(self._format_json_song(row, score))
-            if len(recommendations) >= limit: break
+        for chunk in self._select_results(final_indices, final_scores, limit, allow_explicit, skip_idx=seed_idx,
+                                          chunk_size=chunk_size):
+            yield "recommendations", chunk
 
-        return {
-            "selected": self._format_json_song(seed_row, score=100),
-            "recommendations": recommendations
-        }
+    def get_recommendations_batch(self, seed_names=None, limit=10, allow_explicit=True, seed_ids=None, filters=None):
+        """
+        Seed-based recommendations for many seeds (titles, or track ids via `seed_ids`) at once.
+        All seeds are scored against the catalog in blocked matrix products (one GEMM per block)
+        and the heuristics run across every seed row together.
+        Returns one result per seed, in order (None where the seed is not in the catalog).
+        """
+        if seed_ids is not None:
+            seed_rows = [self._resolve_seed(track_id=i) for i in seed_ids]
+        else:
+            seed_rows = [self._resolve_seed(name=n) for n in seed_names]
+
+        found = [i for i, idx in enumerate(seed_rows) if idx is not None]
+        results = [None] * len(seed_rows)
+        if not found:
+            return results
+        block = max(1, BATCH_SCORE_CELLS // len(self.df))
+        pool = max(HEURISTIC_POOL, limit + 1)
+
+        subset = self._eligible_rows(allow_explicit, normalize_filters(filters))
+        exact = ExactIndex(self.embeddings)
+
+        for start in range(0, len(found), block):
+            positions = found[start:start + block]
+            seed_idx = np.array([seed_rows[p] for p in positions])
+
+            with metrics.stage('similarity'):
+                related_indices, related_scores = exact.search_many(self.embeddings[seed_idx], pool, subset)
+            final_indices, final_scores = self._apply_heuristics(related_indices, related_scores)
+
+            for row, pos in enumerate(positions):
+                results[pos] = {
+                    "selected": self._format_songs([seed_idx[row]], [100])[0],
+                    "recommendations": self._select_results(final_indices[row], final_scores[row], limit, allow_explicit, skip_idx=seed_idx[row])
+                }
+
+        return results
 
-    def get_recommendations_by_features(self, target_features, limit=3, exclude_names=None, allow_explicit=True):
+    def get_recommendations_by_features(self, target_features, limit=3, exclude_names=None, allow_explicit=True,
+                                        filters=None):
         """
         Finds songs closest to a target DNA vector (e.g. average of a playlist).
+        `filters` restricts candidates by year / tempo / duration (see catalog_filters.py).
         """
+        chunks = self.iter_recommendations_by_features(target_features, limit, exclude_names, allow_explicit, filters,
+                                                       chunk_size=max(limit, 1))
+        return [song for chunk in chunks for song in chunk]
+
+    def iter_recommendations_by_features(self, target_features, limit=3, exclude_names=None, allow_explicit=True,
+                                         filters=None, chunk_size=5):
+        """Generator form of get_recommendations_by_features: yields ranked chunks of songs."""
         if self.df is None or self.df.empty:
-            return []
+            return
 
         # Unified feature set (matches get_recommendations) to prevent silent feature drops
-        chart_features = ['danceability', 'energy', 'speechiness', 'acousticness', 'valence', 'instrumentalness']
-        target_vector = np.array([target_features.get(f, 0.5) for f in chart_features]).reshape(1, -1)
-        
-        feature_matrix = self.df[chart_features].values
-        sim_scores = cosine_similarity(target_vector, feature_matrix).flatten()
-        
-        # Initial sort
-        related_indices = sim_scores.argsort()[::-1]
+        target = tuple(round(float(target_features.get(f, 0.5)), FEATURE_QUANTUM) for f in CHART_FEATURES)
+        target_tempo = target_features.get('tempo')
+        if target_tempo is not None:
+            target_tempo = round(float(target_tempo), 1)
+        exclude_set = frozenset(n.lower() for n in exclude_names) if exclude_names else frozenset()
+        filters = normalize_filters(filters)
+
+        cache_key = (target, target_tempo, limit, allow_explicit, exclude_set, filters)
+        cached = self.results_cache.get(cache_key)
+        if cached is not None:
+            # Callers decorate the returned songs (e.g. vibe tags), so hand out fresh dicts
+            for i in range(0, len(cached), chunk_size):
+                yield [dict(song) for song in cached[i:i + chunk_size]]
+            return
+
+        target_vector = _l2_normalize(target)
+
+        # Only the heuristic pool is ever inspected, so skip the full sort
+        with metrics.stage('similarity'):
+            related_indices, related_scores = self.feature_index.search(
+                target_vector, max(HEURISTIC_POOL, limit + len(exclude_set)), self._eligible_rows(allow_explicit, filters))
         
         # Apply Heuristics with calculated target tempo
-        target_tempo = target_features.get('tempo')
-        final_indices, final_scores = self._apply_heuristics(related_indices, sim_scores, target_tempo=target_tempo)
+        final_indices, final_scores = self._apply_heuristics(related_indices, related_scores, target_tempo=target_tempo)
         
         results = []
-        exclude_set = set([n.lower() for n in exclude_names]) if exclude_names else set()
-        
-        for i, r_idx in enumerate(final_indices):
-            row = self.df.iloc[r_idx]
-            if row['track_name'].lower() in exclude_set:
-                continue
-                
-            if not allow_explicit and 'explicit' in row and str(row['explicit']).upper() == 'TRUE':
-                continue
-                
-            score = int(final_scores[i] * 100)
-            results.append(self._format_json_song(row, score))
-            
-            if len(results) >= limit:
-                break
-                
-        return results
+        for chunk in self._select_results(final_indices, final_scores, limit, allow_explicit, exclude_set=exclude_set,
+                                          chunk_size=chunk_size):
+            results.extend(dict(song) for song in chunk)
+            yield chunk
+
+        # Only a fully consumed stream is a complete answer worth caching
+        self.results_cache.set(cache_key, results)
 
-    def get_bridge_recommendation(self, song_a_name, song_b_name, limit=5, allow_explicit=True):
-        """Finds tracks that are sonically midway between two target tracks."""
-        idx_a = self.df.index[self.df['track_name'].str.lower() == song_a_name.lower()].tolist()
-        idx_b = self.df.index[self.df['track_name'].str.lower() == song_b_name.lower()].tolist()
+    def get_bridge_recommendation(self, song_a_name=None, song_b_name=None, limit=5, allow_explicit=True,
+                                  song_a_id=None, song_b_id=None, filters=None):
+        """Finds tracks that are sonically midway between two target tracks (by title or track id)."""
+        idx_a = self._resolve_seed(song_a_name, song_a_id)
+        idx_b = self._resolve_seed(song_b_name, song_b_id)
         
-        if not idx_a or not idx_b: return None
+        if idx_a is None or idx_b is None: return None
         
-        row_a = self.df.iloc[idx_a[0]]
-        row_b = self.df.iloc[idx_b[0]]
+        row_a = self.df.iloc[idx_a]
+        row_b = self.df.iloc[idx_b]
         
-        chart_features = ['danceability', 'energy', 'speechiness', 'acousticness', 'valence', 'instrumentalness']
-        feat_a = np.array([float(row_a.get(f, 0.5)) for f in chart_features])
-        feat_b = np.array([float(row_b.get(f, 0.5)) for f in chart_features])
+        feat_a = np.array([float(row_a.get(f, 0.5)) for f in CHART_FEATURES])
+        feat_b = np.array([float(row_b.get(f, 0.5)) for f in CHART_FEATURES])
         
         # Calculate Midpoint Vector
         midpoint = (feat_a + feat_b) / 2.0
         
-        return self.get_recommendations_by_features({chart_features[i]: midpoint[i] for i in range(len(chart_features))}, limit=limit, allow_explicit=allow_explicit)
+        return self.get_recommendations_by_features({CHART_FEATURES[i]: midpoint[i] for i in range(len(CHART_FEATURES))}, limit=limit, allow_explicit=allow_explicit, filters=filters)
+
+    def get_mix_recommendations(self, track_ids, limit=3, strategy='centroid', allow_explicit=True, filters=None):
+        """
+        Recommendations for a whole playlist, from the catalog rows of its tracks (by id; the
+        client's copy of their features is not used). All member vectors are scored against the
+        catalog in one blocked matrix product, then aggregated by `strategy`:
+          centroid  one query at the mean of the members (the classic Alchemist blend)
+          max_sim   a track scores its best similarity to any member (or, past
+                    MIX_MAX_REPRESENTATIVES members, any k-means representative), so every
+                    corner of a varied playlist is represented
+          kmeans    members are grouped into up to MIX_MAX_CLUSTERS sonic clusters; results are
+                    taken from the clusters in turn, so each one gets its share of the list
+        Members and their titles are excluded. Returns None unless every id is in the catalog
+        (a partial mix would silently ignore the missing tracks).
+        """
+        if strategy not in MIX_STRATEGIES:
+            raise ValueError(f"unknown mix strategy '{strategy}' (expected one of: {', '.join(MIX_STRATEGIES)})")
+        rows = [self._id_index.get(str(i)) for i in track_ids]
+        if not rows or None in rows:
+            return None
+        rows = list(dict.fromkeys(rows))
+
+        members = self._song_features[rows][:, [SONG_FEATURES.index(f) for f in CHART_FEATURES]]
+        subset = self._eligible_rows(allow_explicit, normalize_filters(filters))
+        exclude_set = frozenset(str(self._track_names[r]).lower() for r in rows)
+        pool = max(HEURISTIC_POOL, limit + len(rows))
+
+        if strategy == 'centroid':
+            queries = _l2_normalize(members.mean(axis=0, keepdims=True))
+        elif strategy == 'max_sim':
+            queries = _l2_normalize(members)
+            if len(rows) > MIX_MAX_REPRESENTATIVES:
+                queries = self._mix_clusters(queries, MIX_MAX_REPRESENTATIVES)
+        else:
+            queries = self._mix_clusters(_l2_normalize(members), MIX_MAX_CLUSTERS)
+
+        with metrics.stage('similarity'):
+            if strategy == 'max_sim':
+                related_indices, related_scores = self.feature_index.search_max(queries, pool, subset)
+                related_indices, related_scores = related_indices[None, :], related_scores[None, :]
+            else:
+                related_indices, related_scores = self.feature_index.search_many(queries, pool, subset)
+
+        final_indices, final_scores = self._apply_heuristics(related_indices, related_scores)
+        candidate_lists = [self._select_results(final_indices[i], final_scores[i], limit, allow_explicit,
+                                                exclude_set=exclude_set)
+                           for i in range(final_indices.shape[0])]
+
+        if len(candidate_lists) == 1:
+            return candidate_lists[0][:limit]
+        # Clusters take turns, each contributing its next best track not already taken
+        results, seen = [], set()
+        for song in chain.from_iterable(zip_longest(*candidate_lists)):
+            if song is not None and song["id"] not in seen:
+                seen.add(song["id"])
+                results.append(song)
+                if len(results) == limit:
+                    break
+        return results
+
+    @staticmethod
+    def _mix_clusters(vectors, max_clusters, iterations=10):
+        """
+        Spherical k-means centroids of a playlist's unit feature vectors, k ~ sqrt(members) (at most
+        `max_clusters`). Seeded farthest-first from the first member, so results are deterministic.
+        """
+        k = min(max_clusters, vectors.shape[0], max(1, int(np.ceil(np.sqrt(vectors.shape[0])))))
+        chosen = [0]
+        closest = vectors @ vectors[0]
+        for _ in range(1, k):
+            chosen.append(int(np.argmin(closest)))
+            closest = np.maximum(closest, vectors @ vectors[chosen[-1]])
+        centroids = vectors[chosen].copy()
+
+        for _ in range(iterations):
+            assign = np.argmax(vectors @ centroids.T, axis=1)
+            updated = _l2_normalize(np.stack([
+                vectors[assign == c].sum(axis=0) if np.any(assign == c) else centroids[c] for c in range(k)
+            ]))
+            if np.allclose(updated, centroids):
+                break
+            centroids = updated
+        return centroids
+
+    def build_transition_path(self, song_a_name=None, song_b_name=None, steps=5, allow_explicit=True,
+                              song_a_id=None, song_b_id=None, filters=None):
+        """
+        Ordered playlist that walks from track A to track B: `steps` evenly spaced points on the
+        line between their chart features (tempo interpolated alongside), each filled with the best
+        not-yet-used track. All points are scored in one matrix product over the catalog rather than
+        one scan per step. Returns {"start", "end", "path"}, or None if either track is unknown.
+        """
+        idx_a = self._resolve_seed(song_a_name, song_a_id)
+        idx_b = self._resolve_seed(song_b_name, song_b_id)
+        if idx_a is None or idx_b is None:
+            return None
+
+        endpoints = self.df.iloc[[idx_a, idx_b]][CHART_FEATURES].to_numpy(dtype=np.float64)
+        t = (np.arange(1, steps + 1) / (steps + 1))[:, None]
+        targets = _l2_normalize((1 - t) * endpoints[0] + t * endpoints[1])
+        target_tempos = (1 - t) * self._tempos[idx_a] + t * self._tempos[idx_b]
+
+        # Enough candidates per point that earlier steps cannot use up a later step's pool
+        with metrics.stage('similarity'):
+            related_indices, related_scores = self.feature_index.search_many(
+                targets, HEURISTIC_POOL + steps, self._eligible_rows(allow_explicit, normalize_filters(filters)))
+        final_indices, final_scores = self._apply_heuristics(related_indices, related_scores, target_tempo=target_tempos)
+
+        # Non-repeating: each step takes its best candidate whose row and title are still unused
+        used_rows = {idx_a, idx_b}
+        used_names = {str(self._track_names[i]).lower() for i in used_rows}
+        path_rows, path_scores = [], []
+        for candidates, scores in zip(final_indices.tolist(), final_scores.tolist()):
+            for row, score in zip(candidates, scores):
+                name = str(self._track_names[row]).lower()
+                if score == -np.inf or row in used_rows or name in used_names:
+                    continue
+                used_rows.add(row)
+                used_names.add(name)
+                path_rows.append(row)
+                path_scores.append(int(score * 100))
+                break
+
+        start, end = self._format_songs([idx_a, idx_b], [100, 100])
+        return {"start": start, "end": end, "path": self._format_songs(path_rows, path_scores)}
 
     def resolve_mood(self, mood_query):
         """
         Maps a natural language string to a target DNA feature profile.
         """
         if _NLP_AVAILABLE:
-            result = _nlp_parse_vibe(mood_query)
+            result = self.parse_vibe_full(mood_query)
             if result and result.get('features') and result['confidence'] > 0:
                 print(f"🧠 NLP parse: terms={result['matched_terms']} conf={result['confidence']}")
                 return result['features']
@@ -318,7 +1071,14 @@ class MusicEngine:
         """
         Returns the full NLP result dict (features + tags + matched_terms + confidence).
         Used by the /parse_vibe API endpoint for live chip previews.
+        Parses are cached by normalized text (the parser itself lowercases and strips).
         """
         if _NLP_AVAILABLE:
-            return _nlp_parse_vibe(text)
+            key = text.lower().strip()
+            result = self.vibe_cache.get(key)
+            if result is None:
+                with metrics.stage('nlp_parse'):
+                    result = _nlp_parse_vibe(text)
+                self.vibe_cache.set(key, result)
+            return dict(result)
         return {"features": None, "tags": [], "matched_terms": [], "confidence": 0.0}
@@ -149,6 +149,36 @@ TAG_LABELS = {
 
 BPM_RE = re.compile(r'\b(\d{2,3})\s*bpm\b', re.IGNORECASE)
 
+# Lexicon compiled once: terms in matching priority (longest phrase first, then lexicon order)
+# folded into a single alternation, so one scan finds every whole-word term.
+_SORTED_TERMS = sorted(VIBE_LEXICON.keys(), key=lambda x: len(x.split()), reverse=True)
+_TERM_RANK = {term: rank for rank, term in enumerate(_SORTED_TERMS)}
+LEXICON_RE = re.compile(r'\b(?:' + '|'.join(re.escape(t) for t in _SORTED_TERMS) + r')\b')
+
+
+def _find_terms(text_lower):
+    """
+    Single-pass lexicon scan. Returns (term, start, preceding_words) in priority order.
+    The lookback window sees the text with earlier-priority matches blanked out,
+    exactly as the term-by-term replacement loop this replaces did.
+    """
+    found = sorted(((_TERM_RANK[m.group()], m.start(), m.end()) for m in LEXICON_RE.finditer(text_lower)))
+
+    results = []
+    blanked = []
+    for rank, start, end in found:
+        pieces, cursor = [], 0
+        for b_start, b_end in sorted(b for b in blanked if b[1] <= start):
+            pieces.append(text_lower[cursor:b_start])
+            pieces.append(" " * (b_end - b_start))
+            cursor = b_end
+        pieces.append(text_lower[cursor:start])
+        preceding_text = "".join(pieces).strip()
+
+        results.append((_SORTED_TERMS[rank], start, preceding_text.split()[-2:] if preceding_text else []))
+        blanked.append((start, end))
+    return results
+
 
 def parse_vibe(text: str) -> dict:
     text_lower = text.lower().strip()
@@ -163,57 +193,39 @@ def parse_vibe(text: str) -> dict:
     if bpm_match:
         explicit_tempo = int(bpm_match.group(1))
     
-    # Sort lexicon by word count (longest first)
-    sorted_terms = sorted(VIBE_LEXICON.keys(), key=lambda x: len(x.split()), reverse=True)
-    
-    remaining = text_lower
-    
-    for term in sorted_terms:
-        # Regex to find term as whole word
-        pattern = r'\b' + re.escape(term) + r'\b'
-        matches = list(re.finditer(pattern, remaining))
+    for term, _, preceding_words in _find_terms(text_lower):
+        # Look backwards for modifiers or negators
+        modifier_val = 1.0
+        is_negated = False
+        
+        # Check for modifiers and negators
+        for w in preceding_words:
+            if w in NEGATORS:
+                is_negated = True
+            if w in MODIFIERS:
+                modifier_val *= MODIFIERS[w]
+            if w + " " + preceding_words[-1] in MODIFIERS: # e.g. "a bit"
+                modifier_val *= MODIFIERS[w + " " + preceding_words[-1]]
+        
+        entry = VIBE_LEXICON[term]
+        adjusted_entry = {}
+        for feat, val in entry.items():
+            if feat == "tempo":
+                adjusted_entry[feat] = val if not is_negated else max(60, 200 - val)
+            else:
+                base_delta = (val - 0.5) if val != 0.5 else 0
+                if is_negated:
+                    base_delta = -base_delta
+                
+                adjusted_delta = base_delta * modifier_val
+                adjusted_val = 0.5 + adjusted_delta
+                adjusted_entry[feat] = max(0.0, min(1.0, adjusted_val))
+        
+        term_display = term
+        if is_negated: term_display = "not " + term
+        elif modifier_val != 1.0: term_display = "modified " + term
         
-        for match in matches:
-            idx = match.start()
-            
-            # Look backwards for modifiers or negators
-            preceding_text = remaining[:idx].strip()
-            preceding_words = preceding_text.split()[-2:] if preceding_text else []
-            
-            modifier_val = 1.0
-            is_negated = False
-            
-            # Check for modifiers and negators
-            for w in preceding_words:
-                if w in NEGATORS:
-                    is_negated = True
-                if w in MODIFIERS:
-                    modifier_val *= MODIFIERS[w]
-                if w + " " + preceding_words[-1] in MODIFIERS: # e.g. "a bit"
-                    modifier_val *= MODIFIERS[w + " " + preceding_words[-1]]
-            
-            entry = VIBE_LEXICON[term]
-            adjusted_entry = {}
-            for feat, val in entry.items():
-                if feat == "tempo":
-                    adjusted_entry[feat] = val if not is_negated else max(60, 200 - val)
-                else:
-                    base_delta = (val - 0.5) if val != 0.5 else 0
-                    if is_negated:
-                        base_delta = -base_delta
-                    
-                    adjusted_delta = base_delta * modifier_val
-                    adjusted_val = 0.5 + adjusted_delta
-                    adjusted_entry[feat] = max(0.0, min(1.0, adjusted_val))
-            
-            term_display = term
-            if is_negated: term_display = "not " + term
-            elif modifier_val != 1.0: term_display = "modified " + term
-            
-            matched_entries.append((term_display, adjusted_entry))
-            
-            # replace matched term with spaces so we don't match substrings
-            remaining = remaining[:idx] + " " * len(term) + remaining[match.end():]
+        matched_entries.append((term_display, adjusted_entry))
 
     if not matched_entries and explicit_tempo is None:
         return {"features": None, "tags": [], "matched_terms": [], "confidence": 0.0}
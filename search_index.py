@@ -0,0 +1,110 @@
+"""
+search_index.py — Trigram-indexed fuzzy search over "title artist" strings
+Narrows the catalog to a few thousand candidates with a character-trigram inverted
+index before rapidfuzz scores them, so a query no longer scans every track.
+"""
+from array import array
+
+import numpy as np
+from rapidfuzz import process, fuzz
+
+
+def _trigrams(text):
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+class SearchIndex:
+    def __init__(self, choices, max_candidates=3000, arrays=None):
+        """`arrays` (from to_arrays) restores a persisted index instead of rebuilding it."""
+        # Kept as a persistent list: rapidfuzz scores these exact strings (case-sensitive, as before)
+        self.choices = list(choices)
+        self.max_candidates = max_candidates
+
+        # Rows appended by extend() live in a second, small CSR block
+        self._extra_postings = None
+        self._extra_offsets = None
+
+        if arrays is not None:
+            self.gram_ids = {gram: i for i, gram in enumerate(arrays['grams'])}
+            self.postings = arrays['postings']
+            self.offsets = arrays['offsets']
+            return
+
+        self.gram_ids = {}
+        self.postings, self.offsets = self._build_postings(self.choices, 0)
+
+    def _build_postings(self, choices, first_row):
+        """CSR postings of `choices` (rows numbered from `first_row`), registering new trigrams in gram_ids."""
+        gram_ids = self.gram_ids
+        grams, rows = array('i'), array('i')
+        for row, text in enumerate(choices, first_row):
+            for gram in _trigrams(str(text).lower()):
+                grams.append(gram_ids.setdefault(gram, len(gram_ids)))
+                rows.append(row)
+
+        # CSR layout: postings[offsets[g]:offsets[g + 1]] are the rows containing trigram g, ascending
+        grams = np.frombuffer(grams, dtype=np.int32)
+        order = np.argsort(grams, kind='stable')
+        postings = np.frombuffer(rows, dtype=np.int32)[order]
+        offsets = np.searchsorted(grams[order], np.arange(len(gram_ids) + 1)).astype(np.int64)
+        return postings, offsets
+
+    def extend(self, choices):
+        """
+        Appends rows (catalog delta segments) without touching the existing postings, which may be
+        memory-mapped: the new rows get their own CSR block, consulted alongside the main one.
+        """
+        first_row = len(self.choices)
+        self.choices.extend(choices)
+        if self._extra_postings is not None:
+            # Rebuilt over every appended row: the block stays small (deltas are compacted away)
+            choices = self.choices[self._extra_first:]
+            first_row = self._extra_first
+        self._extra_first = first_row
+        self._extra_postings, self._extra_offsets = self._build_postings(choices, first_row)
+
+    def _rows_with(self, gram):
+        rows = self.postings[self.offsets[gram]:self.offsets[gram + 1]] if gram < len(self.offsets) - 1 else None
+        if self._extra_postings is None:
+            return rows
+        extra = self._extra_postings[self._extra_offsets[gram]:self._extra_offsets[gram + 1]]
+        return extra if rows is None else np.concatenate([rows, extra])
+
+    def to_arrays(self):
+        """Plain-array form of the index, for persistence next to the catalog."""
+        grams = [None] * len(self.gram_ids)
+        for gram, i in self.gram_ids.items():
+            grams[i] = gram
+        return {"grams": grams, "postings": self.postings, "offsets": self.offsets}
+
+    def __len__(self):
+        return len(self.choices)
+
+    def search(self, query, limit=5):
+        """Returns [(choice, score, row)] like rapidfuzz's process.extract with fuzz.partial_ratio."""
+        gram_keys = [self.gram_ids.get(g) for g in _trigrams(query.lower())]
+        known = [g for g in gram_keys if g is not None]
+        if not known:
+            # Too short (or too unusual) to index: score everything
+            return process.extract(query, self.choices, limit=limit, scorer=fuzz.partial_ratio)
+
+        hits = np.concatenate([self._rows_with(g) for g in known])
+        counts = np.bincount(hits, minlength=len(self.choices))
+
+        # Fast path: rows containing the whole query score 100, and ties rank by row order
+        exact = []
+        if len(known) == len(gram_keys):
+            for row in np.flatnonzero(counts == len(known)):
+                if query in self.choices[row]:
+                    exact.append(row)
+                    if len(exact) == limit:
+                        return [(self.choices[r], 100.0, int(r)) for r in exact]
+
+        candidates = np.flatnonzero(counts)
+        if candidates.shape[0] > self.max_candidates:
+            candidates = np.sort(candidates[np.argpartition(counts[candidates], -self.max_candidates)[-self.max_candidates:]])
+            candidates = np.union1d(candidates, np.array(exact, dtype=candidates.dtype))
+
+        # Candidates stay in row order so equal scores tie-break exactly like a full scan
+        matches = process.extract(query, [self.choices[r] for r in candidates], limit=limit, scorer=fuzz.partial_ratio)
+        return [(choice, score, int(candidates[i])) for choice, score, i in matches]